@@ -6,7 +6,9 @@ Handles secure loading of configuration from environment variables and .env file
 """
 
 import os
+import re
 import logging
+import threading
 from dataclasses import dataclass
 from typing import Optional, Dict, Any
 from pathlib import Path
@@ -18,6 +20,9 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Characters Telegram accepts in a webhook secret token
+_WEBHOOK_SECRET_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
 
 @dataclass
 class BotConfig:
@@ -27,6 +32,10 @@ class BotConfig:
     max_retries: int = 3
     timeout_minutes: int = 30
     rate_limit_per_minute: int = 10
+    # Webhook delivery; long polling is used when webhook_url is not set
+    webhook_url: Optional[str] = None
+    webhook_port: int = 8443
+    webhook_secret: Optional[str] = None
 
 
 @dataclass
@@ -55,20 +64,49 @@ class ConfigManager:
     """
     Manages bot configuration with secure token loading and validation.
     Supports loading from environment variables and .env files with fallback mechanisms.
+    
+    Process-wide singleton: every ``ConfigManager()`` call returns the same
+    instance, so the .env file is parsed and validated at most once.
     """
     
+    _instance: Optional['ConfigManager'] = None
+    _instance_lock = threading.Lock()
+    
+    # Absolute .env path -> mtime at the time it was last loaded
+    _loaded_env_files: Dict[str, float] = {}
+    
+    def __new__(cls, env_file_path: str = ".env"):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._initialized = False
+                    cls._instance = instance
+        return cls._instance
+    
     def __init__(self, env_file_path: str = ".env"):
         """
         Initialize configuration manager.
         
         Args:
-            env_file_path: Path to .env file (default: ".env")
+            env_file_path: Path to .env file (default: ".env"). Only the first
+                instantiation's value is used.
         """
+        if self._initialized:
+            return
+        self._initialized = True
         self.env_file_path = env_file_path
         self._config_loaded = False
         self._bot_config: Optional[BotConfig] = None
         self._database_config: Optional[DatabaseConfig] = None
         self._logging_config: Optional[LoggingConfig] = None
+        self._env_snapshot: Dict[str, str] = {}
+    
+    @classmethod
+    def reset(cls) -> None:
+        """Drop the shared instance so the next call reloads configuration (for tests)."""
+        with cls._instance_lock:
+            cls._instance = None
         
     def load_config(self) -> BotConfig:
         """
@@ -86,19 +124,29 @@ class ConfigManager:
         # Load .env file if available and python-dotenv is installed
         self._load_env_file()
         
+        # Snapshot the environment once so later lookups are plain dict hits
+        self._env_snapshot = dict(os.environ)
+        
         # Load bot configuration
         token = self._get_token()
         debug_mode = self._get_bool_env("DEBUG_MODE", False)
         max_retries = self._get_int_env("MAX_RETRIES", 3)
         timeout_minutes = self._get_int_env("TIMEOUT_MINUTES", 30)
         rate_limit_per_minute = self._get_int_env("RATE_LIMIT_PER_MINUTE", 10)
+        webhook_url = self._get_env("WEBHOOK_URL") or None
+        # PORT is what most hosting platforms inject
+        webhook_port = self._get_int_env("WEBHOOK_PORT", self._get_int_env("PORT", 8443))
+        webhook_secret = self._get_env("WEBHOOK_SECRET") or None
         
         self._bot_config = BotConfig(
             token=token,
             debug_mode=debug_mode,
             max_retries=max_retries,
             timeout_minutes=timeout_minutes,
-            rate_limit_per_minute=rate_limit_per_minute
+            rate_limit_per_minute=rate_limit_per_minute,
+            webhook_url=webhook_url.strip().rstrip("/") if webhook_url else None,
+            webhook_port=webhook_port,
+            webhook_secret=webhook_secret.strip() if webhook_secret else None
         )
         
         # Validate configuration
@@ -130,7 +178,7 @@ class ConfigManager:
             DatabaseConfig: Database configuration object
         """
         if not self._database_config:
-            file_path = os.getenv("DATABASE_FILE_PATH", "bot_data.json")
+            file_path = self._get_env("DATABASE_FILE_PATH", "bot_data.json")
             backup_interval = self._get_int_env("DATABASE_BACKUP_INTERVAL", 3600)
             max_file_size = self._get_int_env("DATABASE_MAX_FILE_SIZE", 10485760)
             
@@ -150,8 +198,8 @@ class ConfigManager:
             LoggingConfig: Logging configuration object
         """
         if not self._logging_config:
-            level = os.getenv("LOG_LEVEL", "INFO").upper()
-            file_path = os.getenv("LOG_FILE_PATH", "bot.log")
+            level = self._get_env("LOG_LEVEL", "INFO").upper()
+            file_path = self._get_env("LOG_FILE_PATH", "bot.log")
             max_file_size = self._get_int_env("LOG_MAX_FILE_SIZE", 5242880)
             backup_count = self._get_int_env("LOG_BACKUP_COUNT", 5)
             
@@ -191,25 +239,47 @@ class ConfigManager:
         if self._bot_config.rate_limit_per_minute < 1 or self._bot_config.rate_limit_per_minute > 100:
             raise ConfigurationError("rate_limit_per_minute must be between 1 and 100")
         
+        if self._bot_config.webhook_url:
+            if not self._bot_config.webhook_url.startswith("https://"):
+                raise ConfigurationError("webhook_url must be an https:// URL")
+            
+            if self._bot_config.webhook_port < 1 or self._bot_config.webhook_port > 65535:
+                raise ConfigurationError("webhook_port must be between 1 and 65535")
+            
+            # The webhook path is fixed, so the secret token is what keeps
+            # anyone else from posting forged updates to it
+            secret = self._bot_config.webhook_secret
+            if not secret:
+                raise ConfigurationError("webhook_secret is required when webhook_url is set")
+            if not _WEBHOOK_SECRET_PATTERN.fullmatch(secret):
+                raise ConfigurationError("webhook_secret may only contain A-Z, a-z, 0-9, _ and - (max 256 characters)")
+        
         logger.info("Configuration validation passed")
         return True
     
     def _load_env_file(self) -> None:
-        """Load environment variables from .env file if available."""
-        env_path = Path(self.env_file_path)
+        """Load environment variables from .env file if available and not already loaded."""
+        env_path = Path(self.env_file_path).resolve()
         
-        if env_path.exists():
-            if load_dotenv is None:
-                logger.warning("python-dotenv not installed. Install it to use .env files: pip install python-dotenv")
-                return
-            
-            try:
-                load_dotenv(env_path)
-                logger.info(f"Loaded environment variables from {self.env_file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to load .env file: {e}")
-        else:
+        try:
+            mtime = env_path.stat().st_mtime
+        except OSError:
             logger.info(f"No .env file found at {self.env_file_path}")
+            return
+        
+        if self._loaded_env_files.get(str(env_path)) == mtime:
+            return
+        
+        if load_dotenv is None:
+            logger.warning("python-dotenv not installed. Install it to use .env files: pip install python-dotenv")
+            return
+        
+        try:
+            load_dotenv(env_path)
+            self._loaded_env_files[str(env_path)] = mtime
+            logger.info(f"Loaded environment variables from {self.env_file_path}")
+        except Exception as e:
+            logger.warning(f"Failed to load .env file: {e}")
     
     def _get_token(self) -> str:
         """
@@ -226,13 +296,13 @@ class ConfigManager:
             ConfigurationError: If token is not found
         """
         # Try primary environment variable
-        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        token = self._get_env("TELEGRAM_BOT_TOKEN")
         if token:
             logger.info("Token loaded from TELEGRAM_BOT_TOKEN environment variable")
             return token.strip()
         
         # Try fallback environment variable
-        token = os.getenv("BOT_TOKEN")
+        token = self._get_env("BOT_TOKEN")
         if token:
             logger.info("Token loaded from BOT_TOKEN environment variable")
             return token.strip()
@@ -243,16 +313,24 @@ class ConfigManager:
             "or add it to your .env file."
         )
     
+    def _get_env(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Get raw value from the environment snapshot taken at load time."""
+        if not self._env_snapshot:
+            # Reached before load_config (e.g. get_logging_config first)
+            self._load_env_file()
+            self._env_snapshot = dict(os.environ)
+        return self._env_snapshot.get(key, default)
+    
     def _get_bool_env(self, key: str, default: bool) -> bool:
         """Get boolean value from environment variable."""
-        value = os.getenv(key)
+        value = self._get_env(key)
         if value is None:
             return default
         return value.lower() in ('true', '1', 'yes', 'on')
     
     def _get_int_env(self, key: str, default: int) -> int:
         """Get integer value from environment variable with validation."""
-        value = os.getenv(key)
+        value = self._get_env(key)
         if value is None:
             return default
         
@@ -272,21 +350,26 @@ class ConfigManager:
         if not self._config_loaded:
             self.load_config()
         
+        database_config = self.get_database_config()
+        logging_config = self.get_logging_config()
+        
         return {
             "debug_mode": self._bot_config.debug_mode,
             "max_retries": self._bot_config.max_retries,
             "timeout_minutes": self._bot_config.timeout_minutes,
             "rate_limit_per_minute": self._bot_config.rate_limit_per_minute,
             "token_configured": bool(self._bot_config.token),
+            "webhook_enabled": bool(self._bot_config.webhook_url),
+            "webhook_port": self._bot_config.webhook_port,
             "database_config": {
-                "file_path": self.get_database_config().file_path,
-                "backup_interval": self.get_database_config().backup_interval,
-                "max_file_size": self.get_database_config().max_file_size
+                "file_path": database_config.file_path,
+                "backup_interval": database_config.backup_interval,
+                "max_file_size": database_config.max_file_size
             },
             "logging_config": {
-                "level": self.get_logging_config().level,
-                "file_path": self.get_logging_config().file_path,
-                "max_file_size": self.get_logging_config().max_file_size,
-                "backup_count": self.get_logging_config().backup_count
+                "level": logging_config.level,
+                "file_path": logging_config.file_path,
+                "max_file_size": logging_config.max_file_size,
+                "backup_count": logging_config.backup_count
             }
         }
\ No newline at end of file
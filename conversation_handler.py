@@ -7,9 +7,13 @@ Implements conversation state persistence with TTL, progress tracking, and timeo
 
 import json
 import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any, List
-from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Any, Iterable, List, Set
+from dataclasses import dataclass, field
 from enum import Enum
 import os
 from pathlib import Path
@@ -17,9 +21,87 @@ from pathlib import Path
 from telegram import Update
 from telegram.ext import ContextTypes
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-class ConversationState(Enum):
-    """Enumeration of conversation states."""
+
+def _json_dumps(data: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(raw: bytes) -> Any:
+    """Parse JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+# Fields shared by SessionState and UserProgress
+_PROGRESS_FIELDS = (
+    'adam_mask', 'adam_count', 'ams_score', 'ams_question_index', 'ams_scores',
+    'lifestyle_answers', 'lifestyle_question_index',
+)
+
+# SQLite schema for persisted progress; list-valued columns hold JSON
+_SESSION_COLUMNS = (
+    'user_id', 'current_state', 'adam_mask', 'adam_count', 'ams_score',
+    'ams_question_index', 'ams_scores', 'lifestyle_answers',
+    'lifestyle_question_index', 'start_time', 'last_activity', 'reminded',
+)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    current_state TEXT NOT NULL,
+    adam_mask INTEGER NOT NULL,
+    adam_count INTEGER NOT NULL,
+    ams_score INTEGER NOT NULL,
+    ams_question_index INTEGER NOT NULL,
+    ams_scores BLOB NOT NULL,
+    lifestyle_answers BLOB NOT NULL,
+    lifestyle_question_index INTEGER NOT NULL,
+    start_time REAL NOT NULL,
+    last_activity REAL NOT NULL,
+    reminded INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_activity ON sessions(last_activity);
+"""
+# Unfinished questionnaires inactive since before the cutoff and not yet reminded
+_SELECT_TIMED_OUT = (
+    "SELECT user_id FROM sessions WHERE last_activity <= ? AND reminded = 0 "
+    "AND current_state IN ('adam', 'ams', 'lifestyle')"
+)
+_SELECT_SESSIONS = f"SELECT {', '.join(_SESSION_COLUMNS)} FROM sessions WHERE last_activity > ?"
+_UPSERT_SESSION = (
+    f"INSERT INTO sessions ({', '.join(_SESSION_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(_SESSION_COLUMNS))}) "
+    f"ON CONFLICT(user_id) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in _SESSION_COLUMNS[1:])
+)
+# Imported JSON progress never replaces a row the database already has
+_INSERT_IMPORTED_SESSION = (
+    f"INSERT OR IGNORE INTO sessions ({', '.join(_SESSION_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(_SESSION_COLUMNS))})"
+)
+
+
+TIMEOUT_REMINDER_TEXT = (
+    "⏰ Hola! Veo que has estado inactivo por un tiempo.\n\n"
+    "Tienes un cuestionario en progreso. ¿Te gustaría continuar donde lo dejaste?\n\n"
+    "Usa /status para ver tu progreso actual o /start para continuar."
+)
+
+
+def _log_noop(*args, **kwargs) -> None:
+    """Stand-in for logging callables when no logging system is configured."""
+
+
+class ConversationState(str, Enum):
+    """Enumeration of conversation states (members compare equal to their string values)."""
     START = "start"
     ADAM = "adam"
     AMS = "ams"
@@ -28,37 +110,91 @@ class ConversationState(Enum):
     COMPLETED = "completed"
 
 
-@dataclass
+@dataclass(slots=True)
+class SessionState:
+    """Questionnaire answers kept in the Telegram context as user_data["s"]."""
+    adam_mask: int = 0  # bit i set when ADAM question i was answered "Sí"
+    adam_count: int = 0  # number of ADAM questions answered
+    ams_score: int = 0
+    ams_question_index: int = 0
+    ams_scores: List[int] = field(default_factory=list)  # score of each AMS answer, in order
+    lifestyle_answers: Dict[str, Any] = field(default_factory=dict)
+    lifestyle_question_index: int = 0
+
+
+@dataclass(slots=True)
 class UserProgress:
     """Data model for user conversation progress."""
     user_id: int
     current_state: ConversationState
-    adam_answers: List[bool]
+    adam_mask: int  # bit i set when ADAM question i was answered "Sí"
+    adam_count: int  # number of ADAM questions answered
     ams_score: int
     ams_question_index: int
     lifestyle_answers: Dict[str, Any]
     lifestyle_question_index: int
-    start_time: datetime
-    last_activity: datetime
+    start_time: float  # epoch seconds
+    last_activity: float  # epoch seconds
+    # Older files have no per-answer AMS history
+    ams_scores: List[int] = field(default_factory=list)
+    # Timeout reminder already sent for the current stretch of inactivity
+    reminded: bool = False
+    
+    def to_row(self) -> tuple:
+        """Convert to a parameter tuple in _SESSION_COLUMNS order."""
+        return (
+            self.user_id,
+            self.current_state.value,
+            self.adam_mask,
+            self.adam_count,
+            self.ams_score,
+            self.ams_question_index,
+            _json_dumps(self.ams_scores),
+            _json_dumps(self.lifestyle_answers),
+            self.lifestyle_question_index,
+            self.start_time,
+            self.last_activity,
+            int(self.reminded),
+        )
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for JSON serialization."""
-        data = asdict(self)
-        data['current_state'] = self.current_state.value
-        data['start_time'] = self.start_time.isoformat()
-        data['last_activity'] = self.last_activity.isoformat()
-        return data
+    @classmethod
+    def from_row(cls, row: tuple) -> 'UserProgress':
+        """Create instance from a sessions row in _SESSION_COLUMNS order."""
+        (user_id, state, adam_mask, adam_count, ams_score, ams_question_index,
+         ams_scores, lifestyle_answers, lifestyle_question_index, start_time, last_activity,
+         reminded) = row
+        return cls(
+            user_id=user_id,
+            current_state=ConversationState(state),
+            adam_mask=adam_mask,
+            adam_count=adam_count,
+            ams_score=ams_score,
+            ams_question_index=ams_question_index,
+            ams_scores=_json_loads(ams_scores),
+            lifestyle_answers=_json_loads(lifestyle_answers),
+            lifestyle_question_index=lifestyle_question_index,
+            start_time=start_time,
+            last_activity=last_activity,
+            reminded=bool(reminded),
+        )
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'UserProgress':
         """Create instance from dictionary."""
         data['current_state'] = ConversationState(data['current_state'])
-        data['start_time'] = datetime.fromisoformat(data['start_time'])
-        data['last_activity'] = datetime.fromisoformat(data['last_activity'])
+        # Older files stored the ADAM answers as a list of booleans
+        adam_answers = data.pop('adam_answers', None)
+        if adam_answers is not None:
+            data['adam_mask'] = sum(1 << i for i, answer in enumerate(adam_answers) if answer)
+            data['adam_count'] = len(adam_answers)
+        for key in ('start_time', 'last_activity'):
+            # Older files stored ISO-8601 strings
+            if isinstance(data[key], str):
+                data[key] = datetime.fromisoformat(data[key]).timestamp()
         return cls(**data)
 
 
-@dataclass
+@dataclass(slots=True)
 class ProgressInfo:
     """Information about user's progress in the questionnaire."""
     current_section: str
@@ -67,17 +203,22 @@ class ProgressInfo:
     percentage_complete: float
     time_elapsed: timedelta
     
+    _TEMPLATE = (
+        "📊 <b>Progreso actual:</b>\n"
+        "Sección: {section}\n"
+        "Pregunta {question} de {total}\n"
+        "Completado: {percentage}%\n"
+        "Tiempo transcurrido: {minutes} minutos"
+    )
+    
     def get_progress_message(self) -> str:
         """Generate user-friendly progress message."""
-        percentage = int(self.percentage_complete)
-        elapsed_minutes = int(self.time_elapsed.total_seconds() / 60)
-        
-        return (
-            f"📊 **Progreso actual:**\n"
-            f"Sección: {self.current_section}\n"
-            f"Pregunta {self.current_question} de {self.total_questions}\n"
-            f"Completado: {percentage}%\n"
-            f"Tiempo transcurrido: {elapsed_minutes} minutos"
+        return self._TEMPLATE.format(
+            section=self.current_section,
+            question=self.current_question,
+            total=self.total_questions,
+            percentage=int(self.percentage_complete),
+            minutes=int(self.time_elapsed.total_seconds() // 60)
         )
 
 
@@ -93,17 +234,54 @@ class EnhancedConversationHandler:
             data_dir: Directory to store persistence data
         """
         self.logging_system = logging_system
+        if logging_system:
+            self._log_user = logging_system.log_user_action
+            self._log_info = logging_system.log_info
+        else:
+            self._log_user = self._log_info = _log_noop
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
         
-        # In-memory storage with TTL
+        # In-memory storage with TTL, persisted as one SQLite row per user
         self._user_data: Dict[int, UserProgress] = {}
+        # Background flushes commit on _io_executor's thread, inline ones on
+        # the caller's; _db_lock keeps their transactions from interleaving
+        self._db = sqlite3.connect(self.data_dir / "state.db", isolation_level=None,
+                                   check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-io")
+        self._pending_write = None
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        # Databases created before the reminded column existed
+        if 'reminded' not in {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}:
+            self._db.execute("ALTER TABLE sessions ADD COLUMN reminded INTEGER NOT NULL DEFAULT 0")
+        # Older JSON stores, imported into the database on load
+        self._users_dir = self.data_dir / "users"
         self._data_file = self.data_dir / "conversation_data.json"
         
         # Configuration
         self.ttl_hours = 24
         self.timeout_minutes = 30
         self.cleanup_interval_minutes = 60
+        self.flush_interval_seconds = 5
+        self.flush_delay_seconds = 0.05
+        
+        # Write coalescing: save_progress only marks the user dirty and wakes
+        # the background flusher, which waits flush_delay_seconds so a burst of
+        # saves lands in one transaction, committed off the event loop. Without
+        # a running loop pending rows are written inline at most once per
+        # flush interval.
+        self._dirty_users: Set[int] = set()
+        self._removed_users: Set[int] = set()
+        self._last_flush = time.monotonic()
+        self._flush_event = asyncio.Event()
+        
+        # Monotonic time of the last TTL check per user; checks repeated
+        # within validation_cache_seconds are skipped
+        self._last_validated: Dict[int, float] = {}
+        self.validation_cache_seconds = 1.0
         
         # Question counts for progress calculation
         self.question_counts = {
@@ -111,131 +289,316 @@ class EnhancedConversationHandler:
             ConversationState.AMS: 17,
             ConversationState.LIFESTYLE: 6
         }
+        self._total_questions = sum(self.question_counts.values())
         
         # Load existing data
         self._load_data()
         
         # Start cleanup task (only if event loop is available)
         self._cleanup_task = None
-        try:
-            self._start_cleanup_task()
-        except RuntimeError:
-            # No event loop available (e.g., in tests), skip cleanup task
-            pass
+        self._start_cleanup_task()
     
     def _log_action(self, message: str, user_id: int = None, context: Dict[str, Any] = None):
         """Log action if logging system is available."""
-        if self.logging_system:
-            if user_id:
-                self.logging_system.log_user_action(user_id, message, context)
-            else:
-                self.logging_system.log_info(message, context=context)
+        if user_id:
+            self._log_user(user_id, message, context)
+        else:
+            self._log_info(message, context=context)
+    
+    @property
+    def _dirty(self) -> bool:
+        """Whether there are changes not yet written to the database."""
+        return bool(self._dirty_users or self._removed_users)
     
     def _load_data(self) -> None:
-        """Load conversation data from file."""
+        """Load conversation data from the database."""
+        self._import_json_stores()
+        
+        # Drop expired rows (indexed on last_activity) and keep the rest in memory
+        threshold = self._ttl_threshold()
         try:
-            if self._data_file.exists():
-                with open(self._data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                for user_id_str, user_data in data.items():
-                    try:
-                        user_id = int(user_id_str)
-                        progress = UserProgress.from_dict(user_data)
-                        
-                        # Check if data is still valid (within TTL)
-                        if self._is_data_valid(progress):
-                            self._user_data[user_id] = progress
-                        
-                    except (ValueError, KeyError, TypeError) as e:
-                        self._log_action(f"Error loading user data for {user_id_str}: {e}")
-                        
-                self._log_action(f"Loaded conversation data for {len(self._user_data)} users")
-                
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            self._db.execute("DELETE FROM sessions WHERE last_activity <= ?", (threshold,))
+            rows = self._db.execute(_SELECT_SESSIONS, (threshold,)).fetchall()
+        except sqlite3.Error as e:
             self._log_action(f"Could not load conversation data: {e}")
+            rows = []
+        
+        for row in rows:
+            try:
+                progress = UserProgress.from_row(row)
+            except (ValueError, TypeError) as e:
+                self._log_action(f"Error loading user data for {row[0]}: {e}")
+                continue
+            self._user_data[progress.user_id] = progress
+        
+        self._log_action(f"Loaded conversation data for {len(self._user_data)} users")
+    
+    def _import_json_stores(self) -> None:
+        """Move progress from the old JSON stores (single file or per-user files) into the database."""
+        sources: List[Path] = []
+        if self._data_file.exists():
+            sources.append(self._data_file)
+        if self._users_dir.is_dir():
+            sources.extend(self._users_dir.glob("*.json"))
+        if not sources:
+            return
+        
+        loaded: List[UserProgress] = []
+        for source in sources:
+            try:
+                data = _json_loads(source.read_bytes())
+            except (OSError, ValueError) as e:
+                self._log_action(f"Could not load conversation data from {source.name}: {e}")
+                continue
+            # The single-file store maps user IDs to progress dicts
+            entries = data.values() if source == self._data_file else (data,)
+            for entry in entries:
+                try:
+                    loaded.append(UserProgress.from_dict(entry))
+                except (ValueError, KeyError, TypeError) as e:
+                    self._log_action(f"Error migrating user data from {source.name}: {e}")
+        
+        try:
+            self._write_rows([], [progress.to_row() for progress in loaded], _INSERT_IMPORTED_SESSION)
+        except sqlite3.Error as e:
+            self._log_action(f"Error migrating conversation data: {e}")
+            return
+        
+        # Keep the old stores as *.migrated rather than deleting them
+        if self._data_file in sources:
+            self._data_file.replace(self._data_file.with_name(self._data_file.name + ".migrated"))
+        if self._users_dir.is_dir():
+            migrated_dir = self._users_dir.with_name(self._users_dir.name + ".migrated")
+            migrated_dir.mkdir(exist_ok=True)
+            for source in self._users_dir.glob("*.json"):
+                source.replace(migrated_dir / source.name)
+            try:
+                self._users_dir.rmdir()
+            except OSError:
+                pass
+        self._log_action(f"Migrated JSON conversation data for {len(loaded)} users")
+    
+    def _write_rows(self, removed: Iterable[int], rows: Iterable[tuple],
+                    statement: str = _UPSERT_SESSION) -> None:
+        """Delete and upsert session rows in a single transaction."""
+        db = self._db
+        with self._db_lock:
+            db.execute("BEGIN")
+            try:
+                db.executemany("DELETE FROM sessions WHERE user_id = ?", [(user_id,) for user_id in removed])
+                db.executemany(statement, rows)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+    
+    def _fetch_rows(self, query: str, params: tuple) -> List[tuple]:
+        """Run a read query without interleaving with a write transaction."""
+        with self._db_lock:
+            return self._db.execute(query, params).fetchall()
+    
+    def _delete_user_row(self, user_id: int) -> None:
+        """Queue a single user's row for deletion, dropping any pending write."""
+        self._dirty_users.discard(user_id)
+        self._removed_users.add(user_id)
+        self._schedule_flush()
+    
+    def _take_pending(self) -> tuple:
+        """
+        Snapshot and clear the pending changes.
+        
+        Rows are serialized here, on the caller's thread, so the write itself
+        never reads the live progress objects.
+        
+        Returns:
+            Tuple of (removed user IDs, dirty user IDs, rows to upsert)
+        """
+        user_data = self._user_data
+        removed, dirty = self._removed_users, self._dirty_users
+        self._removed_users, self._dirty_users = set(), set()
+        rows = [user_data[user_id].to_row() for user_id in dirty if user_id in user_data]
+        return removed, dirty, rows
+    
+    def _restore_pending(self, removed: Set[int], dirty: Set[int]) -> None:
+        """Re-queue a snapshot whose write failed, so the next flush retries it."""
+        # Changes made since the snapshot win over the failed ones
+        self._removed_users |= removed - self._dirty_users
+        self._dirty_users |= dirty - self._removed_users
+    
+    def _flushed(self, saved_count: int) -> None:
+        """Record a successful flush."""
+        self._last_flush = time.monotonic()
+        if saved_count:
+            self._log_action(f"Saved conversation data for {saved_count} users")
     
     def _save_data(self) -> None:
-        """Save conversation data to file."""
+        """
+        Write pending per-user changes to the database on the calling thread.
+        
+        Only for when no flusher runs (no event loop, or after stop());
+        inside the loop use _save_data_async.
+        """
+        # An older snapshot still being written must land first
+        if self._pending_write is not None and not self._pending_write.done():
+            try:
+                self._pending_write.result()
+            except Exception:
+                pass
+        removed, dirty, rows = self._take_pending()
         try:
-            # Clean expired data before saving
-            self._cleanup_expired_data()
-            
-            data = {}
-            for user_id, progress in self._user_data.items():
-                data[str(user_id)] = progress.to_dict()
-            
-            # Write to temporary file first, then rename for atomic operation
-            temp_file = self._data_file.with_suffix('.tmp')
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            temp_file.replace(self._data_file)
-            self._log_action(f"Saved conversation data for {len(self._user_data)} users")
-            
+            self._write_rows(removed, rows)
+        except Exception as e:
+            self._restore_pending(removed, dirty)
+            self._log_action(f"Error saving conversation data: {e}")
+        else:
+            self._flushed(len(dirty))
+    
+    async def _save_data_async(self) -> None:
+        """Write pending changes on the I/O thread, keeping the event loop free."""
+        removed, dirty, rows = self._take_pending()
+        try:
+            self._pending_write = self._io_executor.submit(self._write_rows, removed, rows)
+            # Shielded: cancelling the caller (e.g. stop()) must not cancel a
+            # queued write whose rows were already taken off the dirty set
+            await asyncio.shield(asyncio.wrap_future(self._pending_write))
         except Exception as e:
+            self._restore_pending(removed, dirty)
             self._log_action(f"Error saving conversation data: {e}")
+        else:
+            self._flushed(len(dirty))
+    
+    def _schedule_flush(self) -> None:
+        """Hand pending changes to the background flusher, or flush inline."""
+        # The handler is usually built before the bot's loop starts, so make
+        # sure the periodic flusher is running once we are inside it
+        if self._cleanup_task is None:
+            self._start_cleanup_task()
+        # With the background flusher running the write stays off the reply
+        # path; without a loop fall back to flushing inline
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._flush_if_due()
+        else:
+            self._flush_event.set()
+    
+    def _flush_if_due(self) -> None:
+        """Write pending changes if the flush interval has elapsed."""
+        if self._dirty and time.monotonic() - self._last_flush >= self.flush_interval_seconds:
+            self._save_data()
+    
+    async def flush_progress(self) -> None:
+        """
+        Write all pending progress to the database now, on the I/O thread.
+        
+        Used at checkpoints that must be durable (e.g. entering results)
+        instead of waiting for the periodic flush. Returns once every change
+        made so far has been committed.
+        """
+        if self._dirty:
+            # The single I/O thread commits this after any write in flight
+            await self._save_data_async()
+            return
+        pending_write = self._pending_write
+        if pending_write is not None and not pending_write.done():
+            try:
+                await asyncio.shield(asyncio.wrap_future(pending_write))
+            except Exception:
+                # The flusher that submitted it logs and re-queues the rows
+                pass
+    
+    def _ttl_threshold(self) -> float:
+        """Epoch time before which user progress is considered expired."""
+        return time.time() - self.ttl_hours * 3600
     
-    def _is_data_valid(self, progress: UserProgress) -> bool:
-        """Check if user progress data is still valid (within TTL)."""
-        ttl_threshold = datetime.now() - timedelta(hours=self.ttl_hours)
-        return progress.last_activity > ttl_threshold
+    def _is_data_valid(self, progress: UserProgress, *, threshold: Optional[float] = None) -> bool:
+        """
+        Check if user progress data is still valid (within TTL).
+        
+        Args:
+            progress: User progress to check
+            threshold: Precomputed TTL threshold, for callers checking many users
+        """
+        if threshold is None:
+            threshold = self._ttl_threshold()
+        return progress.last_activity > threshold
     
     def _cleanup_expired_data(self) -> None:
         """Remove expired user data."""
-        expired_users = []
+        threshold = self._ttl_threshold()
+        kept: Dict[int, UserProgress] = {}
+        expired_users: List[int] = []
         for user_id, progress in self._user_data.items():
-            if not self._is_data_valid(progress):
+            if self._is_data_valid(progress, threshold=threshold):
+                kept[user_id] = progress
+            else:
                 expired_users.append(user_id)
         
-        for user_id in expired_users:
-            del self._user_data[user_id]
-            self._log_action(f"Cleaned up expired data for user {user_id}")
-        
         if expired_users:
+            self._user_data = kept
+            self._removed_users.update(expired_users)
+            for user_id in expired_users:
+                self._last_validated.pop(user_id, None)
             self._log_action(f"Cleaned up {len(expired_users)} expired user sessions")
     
     def _start_cleanup_task(self) -> None:
         """Start the periodic cleanup task."""
         async def cleanup_loop():
+            cleanup_interval = self.cleanup_interval_minutes * 60
+            last_cleanup = time.monotonic()
             while True:
                 try:
-                    await asyncio.sleep(self.cleanup_interval_minutes * 60)
-                    self._cleanup_expired_data()
-                    self._save_data()
+                    # Sleep until a save arrives or the next cleanup is due
+                    timeout = max(0.0, last_cleanup + cleanup_interval - time.monotonic())
+                    try:
+                        await asyncio.wait_for(self._flush_event.wait(), timeout)
+                        await asyncio.sleep(self.flush_delay_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    # Saves arriving during the write set the event again
+                    self._flush_event.clear()
+                    if time.monotonic() - last_cleanup >= cleanup_interval:
+                        last_cleanup = time.monotonic()
+                        self._cleanup_expired_data()
+                    if self._dirty:
+                        await self._save_data_async()
                 except Exception as e:
                     self._log_action(f"Error in cleanup task: {e}")
         
         try:
             # Check if there's an event loop
             loop = asyncio.get_running_loop()
-            if self._cleanup_task is None or self._cleanup_task.done():
-                self._cleanup_task = loop.create_task(cleanup_loop())
         except RuntimeError:
-            # No event loop running, skip cleanup task
-            pass
+            # No event loop running (e.g., in tests), skip cleanup task
+            return
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = loop.create_task(cleanup_loop())
     
-    def save_progress(self, user_id: int, state: ConversationState, context_data: Dict[str, Any]) -> None:
+    def save_progress(self, user_id: int, state: ConversationState, session: SessionState,
+                      fields: Optional[Iterable[str]] = None) -> None:
         """
         Save user progress to persistent storage.
         
         Args:
             user_id: Telegram user ID
             state: Current conversation state
-            context_data: User data from telegram context
+            session: Questionnaire state from the telegram context
+            fields: Progress fields changed since the last save. When given and
+                the user already has saved progress only these are copied;
+                None copies every progress field.
         """
-        now = datetime.now()
+        now = time.time()
         
         # Get existing progress or create new
-        if user_id in self._user_data:
-            progress = self._user_data[user_id]
+        progress = self._user_data.get(user_id)
+        if progress is not None:
             progress.current_state = state
             progress.last_activity = now
+            progress.reminded = False
         else:
             progress = UserProgress(
                 user_id=user_id,
                 current_state=state,
-                adam_answers=[],
+                adam_mask=0,
+                adam_count=0,
                 ams_score=0,
                 ams_question_index=0,
                 lifestyle_answers={},
@@ -243,26 +606,17 @@ class EnhancedConversationHandler:
                 start_time=now,
                 last_activity=now
             )
+            # A fresh record needs the full state, not just the delta
+            fields = None
         
         # Update progress with context data
-        if "adam_answers" in context_data:
-            progress.adam_answers = context_data["adam_answers"]
+        for key in _PROGRESS_FIELDS if fields is None else fields:
+            setattr(progress, key, getattr(session, key))
         
-        if "ams_score" in context_data:
-            progress.ams_score = context_data["ams_score"]
-        
-        if "ams_question_index" in context_data:
-            progress.ams_question_index = context_data["ams_question_index"]
-        
-        if "lifestyle_answers" in context_data:
-            progress.lifestyle_answers = context_data["lifestyle_answers"]
-        
-        if "lifestyle_question_index" in context_data:
-            progress.lifestyle_question_index = context_data["lifestyle_question_index"]
-        
-        # Save to memory and file
+        # Save to memory; the row write is coalesced
         self._user_data[user_id] = progress
-        self._save_data()
+        self._dirty_users.add(user_id)
+        self._schedule_flush()
         
         self._log_action(
             "progress_saved",
@@ -285,12 +639,16 @@ class EnhancedConversationHandler:
         
         progress = self._user_data[user_id]
         
-        # Check if data is still valid
-        if not self._is_data_valid(progress):
-            del self._user_data[user_id]
-            self._save_data()
-            self._log_action(f"Expired progress data removed for user {user_id}")
-            return None
+        # Check if data is still valid, unless it was checked just now
+        now = time.monotonic()
+        if now - self._last_validated.get(user_id, 0.0) >= self.validation_cache_seconds:
+            if not self._is_data_valid(progress):
+                del self._user_data[user_id]
+                self._last_validated.pop(user_id, None)
+                self._delete_user_row(user_id)
+                self._log_action(f"Expired progress data removed for user {user_id}")
+                return None
+            self._last_validated[user_id] = now
         
         self._log_action(
             "progress_loaded",
@@ -300,17 +658,20 @@ class EnhancedConversationHandler:
         
         return progress
     
-    def get_user_progress(self, user_id: int) -> Optional[ProgressInfo]:
+    def get_user_progress(self, user_id: int,
+                          progress: Optional[UserProgress] = None) -> Optional[ProgressInfo]:
         """
         Get detailed progress information for a user.
         
         Args:
             user_id: Telegram user ID
+            progress: Already loaded progress, to avoid loading it again
             
         Returns:
             ProgressInfo if user has active session, None otherwise
         """
-        progress = self.load_progress(user_id)
+        if progress is None:
+            progress = self.load_progress(user_id)
         if not progress:
             return None
         
@@ -321,7 +682,7 @@ class EnhancedConversationHandler:
         
         if progress.current_state == ConversationState.ADAM:
             current_section = "Cuestionario ADAM"
-            current_question = len(progress.adam_answers) + 1
+            current_question = progress.adam_count + 1
             total_questions = self.question_counts[ConversationState.ADAM]
         elif progress.current_state == ConversationState.AMS:
             current_section = "Cuestionario AMS"
@@ -334,15 +695,14 @@ class EnhancedConversationHandler:
         else:
             current_section = "Iniciando"
             current_question = 1
-            total_questions = sum(self.question_counts.values())
+            total_questions = self._total_questions
         
         # Calculate percentage complete
         total_answered = self._count_answered_questions(progress)
-        total_possible = sum(self.question_counts.values())
-        percentage_complete = (total_answered / total_possible) * 100
+        percentage_complete = (total_answered / self._total_questions) * 100
         
         # Calculate time elapsed
-        time_elapsed = datetime.now() - progress.start_time
+        time_elapsed = timedelta(seconds=time.time() - progress.start_time)
         
         return ProgressInfo(
             current_section=current_section,
@@ -355,22 +715,23 @@ class EnhancedConversationHandler:
     def _count_answered_questions(self, progress: UserProgress) -> int:
         """Count total number of questions answered by user."""
         count = 0
-        count += len(progress.adam_answers)
+        count += progress.adam_count
         count += progress.ams_question_index
         count += progress.lifestyle_question_index
         return count
     
-    def show_progress(self, user_id: int) -> Optional[str]:
+    def show_progress(self, user_id: int, progress: Optional[UserProgress] = None) -> Optional[str]:
         """
         Generate progress message for user.
         
         Args:
             user_id: Telegram user ID
+            progress: Already loaded progress, to avoid loading it again
             
         Returns:
             Progress message string or None if no active session
         """
-        progress_info = self.get_user_progress(user_id)
+        progress_info = self.get_user_progress(user_id, progress)
         if not progress_info:
             return None
         
@@ -391,7 +752,7 @@ class EnhancedConversationHandler:
             return None
         
         # Check if user has been inactive for timeout period
-        timeout_threshold = datetime.now() - timedelta(minutes=self.timeout_minutes)
+        timeout_threshold = time.time() - self.timeout_minutes * 60
         
         if progress.last_activity < timeout_threshold:
             self._log_action(
@@ -400,14 +761,48 @@ class EnhancedConversationHandler:
                 context={"inactive_minutes": self.timeout_minutes}
             )
             
-            return (
-                f"⏰ Hola! Veo que has estado inactivo por un tiempo.\n\n"
-                f"Tienes un cuestionario en progreso. ¿Te gustaría continuar donde lo dejaste?\n\n"
-                f"Usa /status para ver tu progreso actual o /start para continuar."
-            )
+            return TIMEOUT_REMINDER_TEXT
         
         return None
     
+    async def get_timed_out_users(self) -> List[int]:
+        """
+        Find users with an unfinished questionnaire who exceeded the timeout
+        and have not been reminded since their last activity.
+        
+        Runs a single query on the last_activity index. Callers mark each
+        user with mark_reminded once the reminder was actually delivered.
+        
+        Returns:
+            IDs of users to remind
+        """
+        # Make sure the database reflects the latest in-memory progress
+        await self.flush_progress()
+        cutoff = time.time() - self.timeout_minutes * 60
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(
+                self._io_executor, self._fetch_rows, _SELECT_TIMED_OUT, (cutoff,)
+            )
+        except sqlite3.Error as e:
+            self._log_action(f"Error querying timed out sessions: {e}")
+            return []
+        return [row[0] for row in rows]
+    
+    def mark_reminded(self, user_id: int) -> None:
+        """
+        Record that the timeout reminder is done, so it is not sent again
+        until the user becomes active and times out once more.
+        
+        Args:
+            user_id: Telegram user ID
+        """
+        progress = self._user_data.get(user_id)
+        if progress is None:
+            return
+        progress.reminded = True
+        self._dirty_users.add(user_id)
+        self._schedule_flush()
+    
     def clear_user_data(self, user_id: int) -> None:
         """
         Clear all data for a specific user.
@@ -417,7 +812,8 @@ class EnhancedConversationHandler:
         """
         if user_id in self._user_data:
             del self._user_data[user_id]
-            self._save_data()
+            self._last_validated.pop(user_id, None)
+            self._delete_user_row(user_id)
             self._log_action(f"Cleared data for user {user_id}")
     
     def restore_context_from_progress(self, context: ContextTypes.DEFAULT_TYPE, progress: UserProgress) -> None:
@@ -428,11 +824,18 @@ class EnhancedConversationHandler:
             context: Telegram context to restore
             progress: Saved user progress
         """
-        context.user_data["adam_answers"] = progress.adam_answers.copy()
-        context.user_data["ams_score"] = progress.ams_score
-        context.user_data["ams_question_index"] = progress.ams_question_index
-        context.user_data["lifestyle_answers"] = progress.lifestyle_answers.copy()
-        context.user_data["lifestyle_question_index"] = progress.lifestyle_question_index
+        # Share the answers dict instead of copying: save_progress already stores
+        # it by reference and every handler mutation is followed by
+        # save_progress, so both sides always agree anyway.
+        context.user_data["s"] = SessionState(
+            adam_mask=progress.adam_mask,
+            adam_count=progress.adam_count,
+            ams_score=progress.ams_score,
+            ams_question_index=progress.ams_question_index,
+            ams_scores=progress.ams_scores,
+            lifestyle_answers=progress.lifestyle_answers,
+            lifestyle_question_index=progress.lifestyle_question_index,
+        )
         
         self._log_action(
             "context_restored",
@@ -452,17 +855,18 @@ class EnhancedConversationHandler:
         """
         return self.load_progress(user_id) is not None
     
-    def get_recovery_message(self, user_id: int) -> Optional[str]:
+    def get_recovery_message(self, user_id: int, progress: Optional[UserProgress] = None) -> Optional[str]:
         """
         Generate recovery message for returning users.
         
         Args:
             user_id: Telegram user ID
+            progress: Already loaded progress, to avoid loading it again
             
         Returns:
             Recovery message or None if no session to recover
         """
-        progress_info = self.get_user_progress(user_id)
+        progress_info = self.get_user_progress(user_id, progress)
         if not progress_info:
             return None
         
@@ -475,9 +879,14 @@ class EnhancedConversationHandler:
     
     def cleanup(self) -> None:
         """Clean up resources and save data."""
-        if self._cleanup_task and not self._cleanup_task.done():
-            self._cleanup_task.cancel()
+        task = self._cleanup_task
+        # After run_polling/run_webhook the loop is already closed and
+        # cancelling would raise; the task can no longer run anyway
+        if task and not task.done() and not task.get_loop().is_closed():
+            task.cancel()
         
         self._cleanup_expired_data()
         self._save_data()
+        self._io_executor.shutdown(wait=True)
+        self._db.close()
         self._log_action("Conversation handler cleanup completed")
\ No newline at end of file
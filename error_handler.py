@@ -6,20 +6,28 @@ Provides robust error handling with retry mechanisms and user-friendly messages
 """
 
 import asyncio
+import collections
 import logging
+import random
+import re
 import time
 from typing import Dict, Any, Optional, Callable, Union, Tuple
 from enum import Enum
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from functools import wraps
+from functools import partial, wraps
 
-from telegram.error import NetworkError, TimedOut, BadRequest, Forbidden, ChatMigrated
+from telegram.error import NetworkError, TimedOut, BadRequest, Forbidden, ChatMigrated, RetryAfter
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from logging_system import LoggingSystem
 
 
+# Powers of two for the common exponential_base == 2.0 backoff
+_POW2 = [2.0 ** i for i in range(16)]
+
+
 class ErrorType(Enum):
     """Types of errors that can occur"""
     NETWORK_ERROR = "network_error"
@@ -32,6 +40,59 @@ class ErrorType(Enum):
     TELEGRAM_API_ERROR = "telegram_api_error"
 
 
+# Exception class -> ErrorType. Classification walks the exception's MRO, so
+# the most specific match wins (e.g. TimedOut before NetworkError).
+_ERROR_TYPE_TABLE: Dict[type, ErrorType] = {
+    RetryAfter: ErrorType.RATE_LIMIT_ERROR,
+    TimedOut: ErrorType.TIMEOUT_ERROR,
+    asyncio.TimeoutError: ErrorType.TIMEOUT_ERROR,
+    BadRequest: ErrorType.TELEGRAM_API_ERROR,
+    Forbidden: ErrorType.TELEGRAM_API_ERROR,
+    ChatMigrated: ErrorType.TELEGRAM_API_ERROR,
+    NetworkError: ErrorType.NETWORK_ERROR,
+    ConnectionError: ErrorType.NETWORK_ERROR,
+    ValueError: ErrorType.VALIDATION_ERROR,
+    PermissionError: ErrorType.SECURITY_ERROR,
+}
+
+_RATE_LIMIT_PATTERN = re.compile(r'rate limit|too many requests', re.IGNORECASE)
+_RETRY_AFTER_PATTERN = re.compile(r'retry (?:after|in) (\d+)', re.IGNORECASE)
+
+# Telegram send limits as (max requests, window seconds): ~30 messages/s
+# overall, ~1 message/s in a private chat (short bursts tolerated) and
+# 20 messages/min in a group
+_GLOBAL_SEND_LIMIT = (30, 1.0)
+_PRIVATE_CHAT_SEND_LIMIT = (3, 3.0)
+_GROUP_CHAT_SEND_LIMIT = (20, 60.0)
+# Drop idle per-chat windows once this many chats are tracked
+_MAX_TRACKED_CHATS = 10000
+
+# AIMD bounds for concurrent sends: +0.5 per success, halved on 429/timeout
+_INITIAL_SEND_CONCURRENCY = 4.0
+_MIN_SEND_CONCURRENCY = 1.0
+_MAX_SEND_CONCURRENCY = 30.0
+_SEND_CONCURRENCY_STEP = 0.5
+
+# Circuit breaker for with_retry: open after this many consecutive failed
+# calls within the failure window and let a single probe through once the
+# cooldown has passed. Only transient errors count: a blocked chat or a bad
+# request says nothing about Telegram being reachable for other users.
+_CIRCUIT_FAILURE_THRESHOLD = 5
+_CIRCUIT_FAILURE_WINDOW_SECONDS = 30.0
+_CIRCUIT_COOLDOWN_SECONDS = 30.0
+_CIRCUIT_ERROR_TYPES = frozenset({
+    ErrorType.NETWORK_ERROR, ErrorType.TIMEOUT_ERROR, ErrorType.RATE_LIMIT_ERROR,
+})
+
+# Intermediate retry failures are not logged individually; a per-function
+# count is logged at most once per this many seconds
+_SUPPRESSED_SUMMARY_SECONDS = 60.0
+
+
+class CircuitOpenError(Exception):
+    """Raised by with_retry-wrapped functions while their circuit is open"""
+
+
 class RecoveryAction(Enum):
     """Actions to take for error recovery"""
     RETRY = "retry"
@@ -41,7 +102,7 @@ class RecoveryAction(Enum):
     USER_NOTIFICATION = "user_notification"
 
 
-@dataclass
+@dataclass(slots=True)
 class ErrorContext:
     """Context information for error handling"""
     user_id: Optional[int] = None
@@ -50,9 +111,21 @@ class ErrorContext:
     function_name: Optional[str] = None
     attempt_number: int = 1
     additional_data: Optional[Dict[str, Any]] = None
+    prev_delay: Optional[float] = None  # Last retry delay, for decorrelated jitter
+    retry_after: Optional[float] = None  # Server-requested wait for rate limits
 
 
 @dataclass
+class CircuitState:
+    """Consecutive-failure state of one function wrapped by with_retry"""
+    failures: int = 0
+    first_failure_at: float = 0.0  # Monotonic time of the first failure in the current run
+    opened_at: Optional[float] = None  # Monotonic time the circuit opened, None when closed
+    last_error: Optional[Exception] = None
+    probing: bool = False  # A half-open probe call is in flight
+
+
+@dataclass(slots=True)
 class RetryConfig:
     """Configuration for retry mechanisms"""
     max_retries: int = 3
@@ -80,6 +153,25 @@ class ErrorHandler:
         self.retry_config = retry_config or RetryConfig()
         self.logger = logging.getLogger(__name__)
         
+        # Memoized exception class -> ErrorType lookups
+        self._type_cache: Dict[type, ErrorType] = {}
+        
+        # Sliding windows of monotonic send timestamps (global and per chat)
+        self._global_window: collections.deque = collections.deque()
+        self._chat_windows: Dict[int, collections.deque] = {}
+        
+        # AIMD-controlled cap on concurrent sends
+        self._concurrency_limit = _INITIAL_SEND_CONCURRENCY
+        self._sends_in_flight = 0
+        self._send_slot_freed = asyncio.Condition()
+        
+        # Circuit breaker state per wrapped function
+        self._circuits: Dict[str, CircuitState] = {}
+        
+        # Intermediate retry failures not logged since the last summary
+        self._suppressed_retries: collections.Counter = collections.Counter()
+        self._suppressed_since = time.monotonic()
+        
         # User-friendly error messages in Spanish
         self.user_messages = {
             ErrorType.NETWORK_ERROR: {
@@ -115,6 +207,11 @@ class ErrorHandler:
                 'help': 'Reintentando automáticamente...'
             }
         }
+        
+        # Flattened lookups used on the error path
+        self._msg_text = {k: v['message'] for k, v in self.user_messages.items()}
+        self._msg_help = {k: v['help'] for k, v in self.user_messages.items()}
+        self._attempt_suffix = " (Intento {}/%d)" % self.retry_config.max_retries
     
     async def handle_error(self, error: Exception, context: ErrorContext) -> Tuple[RecoveryAction, Optional[str]]:
         """
@@ -127,9 +224,36 @@ class ErrorHandler:
         Returns:
             Tuple[RecoveryAction, Optional[str]]: Recovery action and user message
         """
+        _, recovery_action, user_message = self._handle_classified_error(error, context)
+        return recovery_action, user_message
+    
+    def _handle_classified_error(self, error: Exception, context: ErrorContext,
+                                 silent: bool = False) -> Tuple[ErrorType, RecoveryAction, Optional[str]]:
+        """
+        Same as handle_error, but also returns the error type so callers need not re-classify.
+        
+        With silent=True the error is classified but not logged; the caller
+        decides later whether to log it via _log_handled_error.
+        """
         error_type = self._classify_error(error)
+        context.retry_after = (
+            self._extract_retry_after(error) if error_type is ErrorType.RATE_LIMIT_ERROR else None
+        )
         
         # Log the error
+        if not silent:
+            self._log_handled_error(error, error_type, context)
+        
+        # Determine recovery action
+        recovery_action = self._determine_recovery_action(error_type, context)
+        
+        # Get user message
+        user_message = self._get_user_message(error_type, context)
+        
+        return error_type, recovery_action, user_message
+    
+    def _log_handled_error(self, error: Exception, error_type: ErrorType, context: ErrorContext) -> None:
+        """Log a handled error with its classification and context."""
         self.logging_system.log_error(
             error,
             context={
@@ -142,14 +266,23 @@ class ErrorHandler:
             },
             user_id=context.user_id
         )
+    
+    def _suppress_retry_error(self, function_name: str) -> None:
+        """Count an unlogged intermediate retry failure, logging a periodic summary."""
+        self._suppressed_retries[function_name] += 1
         
-        # Determine recovery action
-        recovery_action = self._determine_recovery_action(error_type, context)
-        
-        # Get user message
-        user_message = self._get_user_message(error_type, context)
+        now = time.monotonic()
+        if now - self._suppressed_since < _SUPPRESSED_SUMMARY_SECONDS:
+            return
         
-        return recovery_action, user_message
+        for name, count in self._suppressed_retries.items():
+            self.logging_system.log_warning(
+                f"{count} transient errors suppressed in {name} in the last "
+                f"{now - self._suppressed_since:.0f}s",
+                context={'function_name': name, 'suppressed': count}
+            )
+        self._suppressed_retries.clear()
+        self._suppressed_since = now
     
     def _classify_error(self, error: Exception) -> ErrorType:
         """
@@ -161,24 +294,43 @@ class ErrorHandler:
         Returns:
             ErrorType: Classified error type
         """
-        # Check most specific Telegram errors first
-        if isinstance(error, (TimedOut, asyncio.TimeoutError)):
-            return ErrorType.TIMEOUT_ERROR
-        elif isinstance(error, BadRequest):
-            if "rate limit" in str(error).lower():
+        error_class = type(error)
+        error_type = self._type_cache.get(error_class)
+        if error_type is None:
+            error_type = ErrorType.SYSTEM_ERROR
+            for klass in error_class.__mro__:
+                if klass in _ERROR_TYPE_TABLE:
+                    error_type = _ERROR_TYPE_TABLE[klass]
+                    break
+            self._type_cache[error_class] = error_type
+        
+        # BadRequest is the only type whose classification depends on the message
+        if error_type is ErrorType.TELEGRAM_API_ERROR and isinstance(error, BadRequest):
+            if _RATE_LIMIT_PATTERN.search(str(error)):
                 return ErrorType.RATE_LIMIT_ERROR
-            else:
-                return ErrorType.TELEGRAM_API_ERROR
-        elif isinstance(error, (Forbidden, ChatMigrated)):
-            return ErrorType.TELEGRAM_API_ERROR
-        elif isinstance(error, (NetworkError, ConnectionError)):
-            return ErrorType.NETWORK_ERROR
-        elif isinstance(error, ValueError):
-            return ErrorType.VALIDATION_ERROR
-        elif isinstance(error, PermissionError):
-            return ErrorType.SECURITY_ERROR
-        else:
-            return ErrorType.SYSTEM_ERROR
+        
+        return error_type
+    
+    @staticmethod
+    def _extract_retry_after(error: Exception) -> Optional[float]:
+        """
+        Get the wait requested by Telegram for a rate-limit error.
+        
+        Args:
+            error: Rate-limit exception
+            
+        Returns:
+            Optional[float]: Seconds to wait, or None if the error does not say
+        """
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            # Newer python-telegram-bot versions use a timedelta
+            if hasattr(retry_after, 'total_seconds'):
+                return retry_after.total_seconds()
+            return float(retry_after)
+        
+        match = _RETRY_AFTER_PATTERN.search(str(error))
+        return float(match.group(1)) if match else None
     
     def _determine_recovery_action(self, error_type: ErrorType, context: ErrorContext) -> RecoveryAction:
         """
@@ -221,15 +373,13 @@ class ErrorHandler:
         Returns:
             Optional[str]: User message or None
         """
-        message_info = self.user_messages.get(error_type)
-        if not message_info:
+        message = self._msg_text.get(error_type)
+        if message is None:
             return None
         
-        message = message_info['message']
-        
         # Add attempt information for retryable errors
-        if context.attempt_number > 1 and error_type in [ErrorType.NETWORK_ERROR, ErrorType.TIMEOUT_ERROR]:
-            message += f" (Intento {context.attempt_number}/{self.retry_config.max_retries})"
+        if context.attempt_number > 1 and error_type in (ErrorType.NETWORK_ERROR, ErrorType.TIMEOUT_ERROR):
+            message += self._attempt_suffix.format(context.attempt_number)
         
         return message
     
@@ -243,42 +393,101 @@ class ErrorHandler:
         Returns:
             Optional[str]: Help message or None
         """
-        message_info = self.user_messages.get(error_type)
-        return message_info['help'] if message_info else None
+        return self._msg_help.get(error_type)
     
-    async def calculate_retry_delay(self, attempt_number: int, error_type: ErrorType) -> float:
+    def calculate_retry_delay(self, attempt_number: int, error_type: ErrorType,
+                              context: Optional[ErrorContext] = None) -> float:
         """
-        Calculate delay before retry using exponential backoff.
+        Calculate delay before retry.
+        
+        With jitter enabled this uses decorrelated jitter
+        (``min(max_delay, uniform(base_delay, prev_delay * 3))``), which spreads
+        concurrent retries far better than a small multiplicative jitter. The
+        previous delay is kept on ``context``. Without jitter it falls back to
+        plain exponential backoff. Rate-limit errors that carry a retry-after
+        value wait exactly that long plus up to one second of jitter.
         
         Args:
             attempt_number: Current attempt number
             error_type: Type of error
+            context: Error context carrying the previous delay across attempts
             
         Returns:
             float: Delay in seconds
         """
-        # Base delay calculation with exponential backoff
-        delay = self.retry_config.base_delay * (self.retry_config.exponential_base ** (attempt_number - 1))
+        # Telegram told us exactly how long to wait
+        if error_type is ErrorType.RATE_LIMIT_ERROR and context and context.retry_after is not None:
+            return context.retry_after + random.uniform(0, 1)
         
-        # Apply maximum delay limit
-        delay = min(delay, self.retry_config.max_delay)
+        config = self.retry_config
+        base = config.base_delay
+        
+        if config.jitter:
+            prev_delay = context.prev_delay if context and context.prev_delay else base
+            delay = min(config.max_delay, random.uniform(base, prev_delay * 3))
+            if context is not None:
+                context.prev_delay = delay
+        else:
+            # Base delay calculation with exponential backoff
+            if config.exponential_base == 2.0:
+                delay = base * _POW2[min(attempt_number - 1, len(_POW2) - 1)]
+            else:
+                delay = base * (config.exponential_base ** (attempt_number - 1))
+            
+            # Apply maximum delay limit
+            delay = min(delay, config.max_delay)
         
         # Special handling for rate limit errors
         if error_type == ErrorType.RATE_LIMIT_ERROR:
             delay = max(delay, 30.0)  # Minimum 30 seconds for rate limits
         
-        # Add jitter to prevent thundering herd
-        if self.retry_config.jitter:
-            import random
-            jitter = random.uniform(0.1, 0.3) * delay
-            delay += jitter
-        
         return delay
     
+    def _record_circuit_failure(self, key: str, error: Exception) -> bool:
+        """
+        Count a failed call of a wrapped function, opening its circuit at the threshold.
+        
+        Failures further apart than the failure window start a new count.
+        
+        Args:
+            key: Wrapped function key
+            error: Transient exception that made the call fail
+            
+        Returns:
+            bool: True if the circuit is now open
+        """
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = CircuitState()
+        
+        now = time.monotonic()
+        if circuit.failures and now - circuit.first_failure_at > _CIRCUIT_FAILURE_WINDOW_SECONDS:
+            circuit.failures = 0
+        if not circuit.failures:
+            circuit.first_failure_at = now
+        circuit.failures += 1
+        circuit.last_error = error
+        # A failure while already open (e.g. the half-open probe) restarts the cooldown
+        if circuit.opened_at is not None or circuit.failures >= _CIRCUIT_FAILURE_THRESHOLD:
+            circuit.opened_at = now
+            self.logging_system.log_warning(
+                f"Circuit opened for {key} after {circuit.failures} consecutive failures",
+                context={'function': key, 'failures': circuit.failures,
+                         'cooldown': _CIRCUIT_COOLDOWN_SECONDS}
+            )
+            return True
+        return False
+    
     def with_retry(self, max_retries: Optional[int] = None):
         """
         Decorator for automatic retry with exponential backoff.
         
+        A circuit breaker is kept per wrapped function: after repeated
+        consecutive calls failing with transient errors, further calls fail
+        fast with CircuitOpenError (chained from the last error) until a
+        cooldown has passed, then a single probe attempt decides whether the
+        circuit closes again.
+        
         Args:
             max_retries: Override default max retries
             
@@ -286,41 +495,82 @@ class ErrorHandler:
             Decorator function
         """
         def decorator(func: Callable):
+            circuit_key = f"{func.__module__}.{func.__qualname__}"
+            
             @wraps(func)
             async def wrapper(*args, **kwargs):
                 retries = max_retries or self.retry_config.max_retries
                 last_error = None
                 
-                for attempt in range(1, retries + 1):
-                    try:
-                        return await func(*args, **kwargs)
-                    except Exception as e:
-                        last_error = e
-                        
-                        # Create error context
-                        context = ErrorContext(
-                            function_name=func.__name__,
-                            attempt_number=attempt,
-                            additional_data={'args_count': len(args), 'kwargs_keys': list(kwargs.keys())}
-                        )
-                        
-                        # Handle the error
-                        recovery_action, user_message = await self.handle_error(e, context)
-                        
-                        # If this is the last attempt or we shouldn't retry, raise the error
-                        if attempt == retries or recovery_action != RecoveryAction.RETRY:
-                            raise e
-                        
-                        # Calculate delay and wait
-                        error_type = self._classify_error(e)
-                        delay = await self.calculate_retry_delay(attempt, error_type)
-                        
-                        self.logging_system.log_warning(
-                            f"Retrying {func.__name__} in {delay:.2f} seconds (attempt {attempt}/{retries})",
-                            context={'delay': delay, 'attempt': attempt, 'max_retries': retries}
-                        )
-                        
-                        await asyncio.sleep(delay)
+                # Fail fast while the circuit is open; half-open allows one probe
+                circuit = self._circuits.get(circuit_key)
+                probe = None
+                if circuit is not None and circuit.opened_at is not None:
+                    if circuit.probing or time.monotonic() - circuit.opened_at < _CIRCUIT_COOLDOWN_SECONDS:
+                        raise CircuitOpenError(f"Circuit open for {circuit_key}") from circuit.last_error
+                    probe = circuit
+                    probe.probing = True
+                    retries = 1
+                
+                # Created on first failure and reused so the jitter state
+                # carries across attempts
+                context = None
+                
+                try:
+                    for attempt in range(1, retries + 1):
+                        try:
+                            result = await func(*args, **kwargs)
+                            if circuit_key in self._circuits:
+                                del self._circuits[circuit_key]
+                            return result
+                        except Exception as e:
+                            last_error = e
+                            
+                            # Create error context; the call summary is only needed if errors get logged
+                            if context is None:
+                                additional_data = None
+                                if self.logging_system.get_logger('errors').isEnabledFor(logging.ERROR):
+                                    additional_data = {'args_count': len(args), 'kwargs_keys': list(kwargs)}
+                                context = ErrorContext(
+                                    function_name=func.__name__,
+                                    additional_data=additional_data
+                                )
+                            context.attempt_number = attempt
+                            
+                            # Handle the error; only the first and the final failure are logged
+                            error_type, recovery_action, _ = self._handle_classified_error(
+                                e, context, silent=attempt > 1
+                            )
+                            
+                            # Stop on the last attempt, when we shouldn't retry, or
+                            # when another call has opened the circuit meanwhile
+                            circuit = self._circuits.get(circuit_key)
+                            final = (attempt == retries or recovery_action != RecoveryAction.RETRY
+                                     or (circuit is not None and circuit.opened_at is not None
+                                         and circuit is not probe))
+                            if attempt > 1:
+                                if final:
+                                    self._log_handled_error(e, error_type, context)
+                                else:
+                                    self._suppress_retry_error(func.__name__)
+                            if final:
+                                if error_type in _CIRCUIT_ERROR_TYPES:
+                                    self._record_circuit_failure(circuit_key, e)
+                                raise e
+                            
+                            # Calculate delay and wait
+                            delay = self.calculate_retry_delay(attempt, error_type, context)
+                            
+                            self.logging_system.log_warning(
+                                f"Retrying {func.__name__} in {delay:.2f} seconds (attempt {attempt}/{retries})",
+                                context={'delay': delay, 'attempt': attempt, 'max_retries': retries}
+                            )
+                            
+                            await asyncio.sleep(delay)
+                finally:
+                    # Also on cancellation, so a lost probe never wedges the circuit
+                    if probe is not None:
+                        probe.probing = False
                 
                 # If we get here, all retries failed
                 if last_error:
@@ -329,6 +579,101 @@ class ErrorHandler:
             return wrapper
         return decorator
     
+    @staticmethod
+    def _window_wait(window: collections.deque, now: float, limit: Tuple[int, float]) -> float:
+        """
+        Drop expired timestamps from a sliding window and return how long to wait.
+        
+        Args:
+            window: Timestamps of recent sends, oldest first
+            now: Current monotonic time
+            limit: (max requests, window seconds)
+            
+        Returns:
+            float: Seconds until another send fits in the window (0 if it fits now)
+        """
+        max_requests, period = limit
+        while window and now - window[0] >= period:
+            window.popleft()
+        if len(window) >= max_requests:
+            return window[0] + period - now
+        return 0.0
+    
+    def _prune_chat_windows(self) -> None:
+        """Forget chats with no sends inside the longest per-chat window."""
+        cutoff = time.monotonic() - _GROUP_CHAT_SEND_LIMIT[1]
+        self._chat_windows = {
+            chat_id: window for chat_id, window in self._chat_windows.items()
+            if window and window[-1] > cutoff
+        }
+    
+    async def wait_if_throttled(self, chat_id: Optional[int]) -> None:
+        """
+        Wait until a request to chat_id fits within Telegram's send limits.
+        
+        Admission control before the API call, so bursts are smoothed out
+        instead of being rejected with 429 and retried.
+        
+        Args:
+            chat_id: Target chat ID (None applies only the global limit)
+        """
+        chat_window = None
+        chat_limit = _PRIVATE_CHAT_SEND_LIMIT
+        if chat_id is not None:
+            chat_window = self._chat_windows.get(chat_id)
+            if chat_window is None:
+                if len(self._chat_windows) >= _MAX_TRACKED_CHATS:
+                    self._prune_chat_windows()
+                chat_window = self._chat_windows[chat_id] = collections.deque()
+            if chat_id < 0:
+                chat_limit = _GROUP_CHAT_SEND_LIMIT
+        
+        while True:
+            now = time.monotonic()
+            wait = self._window_wait(self._global_window, now, _GLOBAL_SEND_LIMIT)
+            if chat_window is not None:
+                wait = max(wait, self._window_wait(chat_window, now, chat_limit))
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        
+        self._global_window.append(now)
+        if chat_window is not None:
+            chat_window.append(now)
+    
+    @asynccontextmanager
+    async def _send_slot(self):
+        """Hold one of the currently allowed concurrent send slots."""
+        async with self._send_slot_freed:
+            await self._send_slot_freed.wait_for(
+                lambda: self._sends_in_flight < int(self._concurrency_limit)
+            )
+            self._sends_in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._send_slot_freed:
+                self._sends_in_flight -= 1
+                self._send_slot_freed.notify_all()
+    
+    def _adjust_concurrency(self, success: bool) -> None:
+        """
+        Additive-increase / multiplicative-decrease of the send concurrency cap.
+        
+        Args:
+            success: Whether the last send succeeded (False on 429/timeout)
+        """
+        if success:
+            self._concurrency_limit = min(_MAX_SEND_CONCURRENCY,
+                                          self._concurrency_limit + _SEND_CONCURRENCY_STEP)
+            return
+        
+        self._concurrency_limit = max(_MIN_SEND_CONCURRENCY, self._concurrency_limit * 0.5)
+        self.logging_system.log_warning(
+            f"Send concurrency reduced to {self._concurrency_limit:.1f}",
+            context={'concurrency_limit': self._concurrency_limit}
+        )
+    
     async def safe_send_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
                                text: str, **kwargs) -> bool:
         """
@@ -343,33 +688,51 @@ class ErrorHandler:
         Returns:
             bool: True if message sent successfully, False otherwise
         """
-        try:
-            if update.message:
-                await update.message.reply_text(text, **kwargs)
-            elif update.callback_query:
-                await update.callback_query.message.reply_text(text, **kwargs)
-            else:
-                await context.bot.send_message(chat_id=update.effective_chat.id, text=text, **kwargs)
-            return True
-        except Exception as e:
-            error_context = ErrorContext(
-                user_id=update.effective_user.id if update.effective_user else None,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                function_name='safe_send_message'
-            )
-            
-            recovery_action, user_message = await self.handle_error(e, error_context)
-            
-            # Try fallback method if available
-            if recovery_action == RecoveryAction.FALLBACK:
-                try:
-                    # Simple fallback - just send to chat
-                    await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
-                    return True
-                except Exception:
-                    pass
-            
-            return False
+        chat = update.effective_chat
+        chat_id = chat.id if chat else None
+        
+        # Resolve the send method once. Inline-mode callbacks and very old
+        # messages have no (accessible) message to reply to, so those go
+        # straight to the chat; a missing chat fails inside the try below.
+        query = update.callback_query
+        query_message = query.message if query else None
+        if update.message:
+            send = update.message.reply_text
+        elif query_message is not None and hasattr(query_message, 'reply_text'):
+            send = query_message.reply_text
+        else:
+            send = partial(context.bot.send_message, chat_id=chat_id)
+        
+        await self.wait_if_throttled(chat_id)
+        async with self._send_slot():
+            try:
+                await send(text=text, **kwargs)
+                self._adjust_concurrency(success=True)
+                return True
+            except Exception as e:
+                user = update.effective_user
+                error_context = ErrorContext(
+                    user_id=user.id if user else None,
+                    chat_id=chat_id,
+                    function_name='safe_send_message'
+                )
+                
+                error_type, recovery_action, user_message = self._handle_classified_error(e, error_context)
+                
+                # Back off concurrency when Telegram pushes back
+                if error_type in (ErrorType.RATE_LIMIT_ERROR, ErrorType.TIMEOUT_ERROR):
+                    self._adjust_concurrency(success=False)
+                
+                # Try fallback method if available
+                if recovery_action == RecoveryAction.FALLBACK:
+                    try:
+                        # Simple fallback - just send to chat
+                        await context.bot.send_message(chat_id=chat_id, text=text)
+                        return True
+                    except Exception:
+                        pass
+                
+                return False
     
     async def safe_edit_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
                                text: str, **kwargs) -> bool:
@@ -385,15 +748,21 @@ class ErrorHandler:
         Returns:
             bool: True if message edited successfully, False otherwise
         """
+        chat = update.effective_chat
+        chat_id = chat.id if chat else None
+        callback_query = update.callback_query
+        
+        await self.wait_if_throttled(chat_id)
         try:
-            if update.callback_query:
-                await update.callback_query.edit_message_text(text, **kwargs)
+            if callback_query:
+                await callback_query.edit_message_text(text, **kwargs)
                 return True
         except Exception as e:
+            user = update.effective_user
             error_context = ErrorContext(
-                user_id=update.effective_user.id if update.effective_user else None,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                message_id=update.callback_query.message.message_id if update.callback_query else None,
+                user_id=user.id if user else None,
+                chat_id=chat_id,
+                message_id=callback_query.message.message_id if callback_query else None,
                 function_name='safe_edit_message'
             )
             
@@ -5,21 +5,38 @@ Enhanced Logging System for Telegram Bot Security Improvements
 Provides structured logging with file rotation, different levels, and security event tracking
 """
 
+import atexit
 import logging
 import logging.handlers
 import os
 import json
+import queue
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pathlib import Path
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 
 from config_manager import LoggingConfig
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-@dataclass
+# Optional record attributes copied into the structured entry
+_EXTRA_FIELDS = ('user_id', 'action', 'context', 'error_type', 'stack_trace')
+
+# File writes are batched: up to this many records, or this many seconds
+# (checked when the next record arrives, and by the listener thread when the
+# queue stays idle that long); ERROR and above flush immediately
+_BUFFER_CAPACITY = 256
+_BUFFER_FLUSH_SECONDS = 5.0
+
+
+@dataclass(slots=True)
 class LogEntry:
-    """Structured log entry"""
+    """Structured log entry (schema of the JSON objects StructuredFormatter emits)"""
     timestamp: str
     level: str
     logger_name: str
@@ -34,29 +51,136 @@ class LogEntry:
 class StructuredFormatter(logging.Formatter):
     """Custom formatter for structured logging"""
     
+    # (whole second, ISO string) of the most recently formatted timestamp
+    _ts_cache = (0, "")
+    
+    def _format_timestamp(self, created: float) -> str:
+        """Format a record timestamp, reusing the ISO prefix within the same second."""
+        sec = int(created)
+        cached_sec, cached_iso = self._ts_cache
+        if sec != cached_sec:
+            cached_iso = datetime.fromtimestamp(sec).isoformat()
+            self._ts_cache = (sec, cached_iso)
+        return f"{cached_iso}.{int((created - sec) * 1e6):06d}"
+    
     def format(self, record):
-        # Create base log entry
-        log_entry = LogEntry(
-            timestamp=datetime.fromtimestamp(record.created).isoformat(),
-            level=record.levelname,
-            logger_name=record.name,
-            message=record.getMessage()
-        )
+        # Build the entry as a plain dict with the same keys as LogEntry
+        record_dict = record.__dict__
+        log_entry = {
+            'timestamp': self._format_timestamp(record.created),
+            'level': record.levelname,
+            'logger_name': record.name,
+            'message': record.getMessage()
+        }
         
         # Add additional fields if present
-        if hasattr(record, 'user_id'):
-            log_entry.user_id = record.user_id
-        if hasattr(record, 'action'):
-            log_entry.action = record.action
-        if hasattr(record, 'context'):
-            log_entry.context = record.context
-        if hasattr(record, 'error_type'):
-            log_entry.error_type = record.error_type
-        if hasattr(record, 'stack_trace'):
-            log_entry.stack_trace = record.stack_trace
+        for field_name in _EXTRA_FIELDS:
+            log_entry[field_name] = record_dict.get(field_name)
+        
+        # Stringify the traceback only for records that actually get written
+        if log_entry['stack_trace'] is None and record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            log_entry['stack_trace'] = record.exc_text
         
         # Return JSON formatted log entry
-        return json.dumps(asdict(log_entry), ensure_ascii=False, separators=(',', ':'))
+        if orjson is not None:
+            return orjson.dumps(log_entry, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return json.dumps(log_entry, ensure_ascii=False, separators=(',', ':'))
+
+
+class _BatchRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that writes a batch of records with a single size check and flush."""
+    
+    def emit_batch(self, records: List[logging.LogRecord]) -> None:
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.seek(0, 2)
+            size = self.stream.tell()
+            
+            parts = []
+            for record in records:
+                msg = self.format(record) + self.terminator
+                if self.maxBytes > 0 and size and size + len(msg) >= self.maxBytes:
+                    # Write what fits, then continue in a fresh file
+                    self.stream.write(''.join(parts))
+                    parts.clear()
+                    self.doRollover()
+                    if self.stream is None:
+                        self.stream = self._open()
+                    size = 0
+                parts.append(msg)
+                size += len(msg)
+            
+            self.stream.write(''.join(parts))
+            self.stream.flush()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+
+class _BufferedFileHandler(logging.handlers.MemoryHandler):
+    """MemoryHandler that hands its buffer to a _BatchRotatingFileHandler in one write."""
+    
+    def __init__(self, target: _BatchRotatingFileHandler):
+        super().__init__(_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=target)
+        self._last_flush = time.monotonic()
+    
+    def shouldFlush(self, record):
+        return (super().shouldFlush(record)
+                or time.monotonic() - self._last_flush >= _BUFFER_FLUSH_SECONDS)
+    
+    def flush(self):
+        self.acquire()
+        try:
+            if self.target and self.buffer:
+                self.target.emit_batch(self.buffer)
+                self.buffer.clear()
+            self._last_flush = time.monotonic()
+        finally:
+            self.release()
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for an in-process queue: enqueue the record as-is, unformatted."""
+    
+    def prepare(self, record):
+        # No pickling happens, so formatting is left to the listener thread
+        return record
+
+
+class _RoutingQueueListener(logging.handlers.QueueListener):
+    """Single listener thread that dispatches each record to its own logger's handlers."""
+    
+    def __init__(self, log_queue, routes: Dict[str, List[logging.Handler]]):
+        super().__init__(log_queue)
+        self._routes = routes
+    
+    def dequeue(self, block):
+        # Wake up periodically while idle so buffered records never wait for
+        # the next one to arrive before reaching the file
+        while True:
+            try:
+                return self.queue.get(block, timeout=_BUFFER_FLUSH_SECONDS if block else None)
+            except queue.Empty:
+                if not block:
+                    raise
+                self._flush_buffers()
+    
+    def _flush_buffers(self) -> None:
+        """Write out every buffered file handler (the queue has been idle)."""
+        for handlers in self._routes.values():
+            for handler in handlers:
+                if isinstance(handler, _BufferedFileHandler) and handler.buffer:
+                    handler.flush()
+    
+    def handle(self, record):
+        for handler in self._routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
 
 
 class LoggingSystem:
@@ -73,7 +197,14 @@ class LoggingSystem:
         """
         self.config = config
         self.loggers: Dict[str, logging.Logger] = {}
+        self._log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        # Logger name -> handlers that the listener thread writes to
+        self._handler_routes: Dict[str, List[logging.Handler]] = {}
+        self._file_handlers: List[_BatchRotatingFileHandler] = []
+        self._listener: Optional[_RoutingQueueListener] = None
+        self._structured_formatter = StructuredFormatter()
         self._setup_loggers()
+        atexit.register(self.close)
     
     def _setup_loggers(self) -> None:
         """Setup all loggers with appropriate handlers and formatters."""
@@ -81,108 +212,81 @@ class LoggingSystem:
         log_dir = Path(self.config.file_path).parent
         log_dir.mkdir(parents=True, exist_ok=True)
         
-        # Setup main application logger
-        self._setup_main_logger()
-        
-        # Setup security logger
-        self._setup_security_logger()
+        # (key, logger name, log file, level, console output)
+        logger_specs = [
+            ('main', 'bot.main', Path(self.config.file_path), getattr(logging, self.config.level), True),
+            ('security', 'bot.security', log_dir / 'security.log', logging.INFO, False),
+            ('errors', 'bot.errors', log_dir / 'errors.log', logging.WARNING, False),
+            ('user_actions', 'bot.user_actions', log_dir / 'user_actions.log', logging.INFO, False),
+        ]
+        for key, name, file_path, level, console in logger_specs:
+            self.loggers[key] = self._make_file_logger(name, file_path, level, console)
         
-        # Setup error logger
-        self._setup_error_logger()
+        # Direct references for the log_* hot paths
+        self._main_logger = self.loggers['main']
+        self._security_logger = self.loggers['security']
+        self._error_logger = self.loggers['errors']
+        self._user_action_logger = self.loggers['user_actions']
         
-        # Setup user action logger
-        self._setup_user_action_logger()
+        # File and console writes happen on the listener thread, off the event loop
+        self._listener = _RoutingQueueListener(self._log_queue, self._handler_routes)
+        self._listener.start()
     
-    def _setup_main_logger(self) -> None:
-        """Setup main application logger."""
-        logger = logging.getLogger('bot.main')
-        logger.setLevel(getattr(logging, self.config.level))
+    def _make_file_logger(self, name: str, file_path: Path, level: int,
+                          console: bool = False) -> logging.Logger:
+        """
+        Create a logger that writes structured JSON to a rotating file.
+        
+        Args:
+            name: Logger name
+            file_path: Log file path
+            level: Logger level
+            console: Also echo records to the console
+            
+        Returns:
+            logging.Logger: Configured logger
+        """
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
         
         # Remove existing handlers to avoid duplicates
         logger.handlers.clear()
         
-        # File handler with rotation
-        file_handler = logging.handlers.RotatingFileHandler(
-            filename=self.config.file_path,
+        # File handler with rotation, fed in batches from a memory buffer
+        file_handler = _BatchRotatingFileHandler(
+            filename=file_path,
             maxBytes=self.config.max_file_size,
             backupCount=self.config.backup_count,
             encoding='utf-8'
         )
-        file_handler.setFormatter(StructuredFormatter())
-        logger.addHandler(file_handler)
+        file_handler.setFormatter(self._structured_formatter)
+        self._file_handlers.append(file_handler)
+        handlers = [_BufferedFileHandler(file_handler)]
         
         # Console handler for development
-        console_handler = logging.StreamHandler()
-        console_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        console_handler.setFormatter(console_formatter)
-        logger.addHandler(console_handler)
-        
-        self.loggers['main'] = logger
-    
-    def _setup_security_logger(self) -> None:
-        """Setup security events logger."""
-        logger = logging.getLogger('bot.security')
-        logger.setLevel(logging.INFO)
-        
-        # Remove existing handlers
-        logger.handlers.clear()
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+            ))
+            handlers.append(console_handler)
         
-        # Separate file for security events
-        security_log_path = Path(self.config.file_path).parent / 'security.log'
-        file_handler = logging.handlers.RotatingFileHandler(
-            filename=security_log_path,
-            maxBytes=self.config.max_file_size,
-            backupCount=self.config.backup_count,
-            encoding='utf-8'
-        )
-        file_handler.setFormatter(StructuredFormatter())
-        logger.addHandler(file_handler)
-        
-        self.loggers['security'] = logger
+        # Route logger through the shared queue to its own handlers
+        logger.addHandler(_LocalQueueHandler(self._log_queue))
+        self._handler_routes[name] = handlers
+        return logger
     
-    def _setup_error_logger(self) -> None:
-        """Setup error logger."""
-        logger = logging.getLogger('bot.errors')
-        logger.setLevel(logging.WARNING)
-        
-        # Remove existing handlers
-        logger.handlers.clear()
-        
-        # Separate file for errors
-        error_log_path = Path(self.config.file_path).parent / 'errors.log'
-        file_handler = logging.handlers.RotatingFileHandler(
-            filename=error_log_path,
-            maxBytes=self.config.max_file_size,
-            backupCount=self.config.backup_count,
-            encoding='utf-8'
-        )
-        file_handler.setFormatter(StructuredFormatter())
-        logger.addHandler(file_handler)
-        
-        self.loggers['errors'] = logger
-    
-    def _setup_user_action_logger(self) -> None:
-        """Setup user actions logger."""
-        logger = logging.getLogger('bot.user_actions')
-        logger.setLevel(logging.INFO)
-        
-        # Remove existing handlers
-        logger.handlers.clear()
-        
-        # Separate file for user actions
-        user_log_path = Path(self.config.file_path).parent / 'user_actions.log'
-        file_handler = logging.handlers.RotatingFileHandler(
-            filename=user_log_path,
-            maxBytes=self.config.max_file_size,
-            backupCount=self.config.backup_count,
-            encoding='utf-8'
-        )
-        file_handler.setFormatter(StructuredFormatter())
-        logger.addHandler(file_handler)
-        
-        self.loggers['user_actions'] = logger
+    def close(self) -> None:
+        """Drain queued records, stop the listener thread and close all handlers."""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._listener = None
+        for handlers in self._handler_routes.values():
+            for handler in handlers:
+                handler.close()
+        for file_handler in self._file_handlers:
+            file_handler.close()
     
     def log_user_action(self, user_id: int, action: str, context: Optional[Dict[str, Any]] = None) -> None:
         """
@@ -193,16 +297,19 @@ class LoggingSystem:
             action: Action performed
             context: Additional context data
         """
-        logger = self.loggers.get('user_actions')
-        if logger:
-            logger.info(
-                f"User {user_id} performed action: {action}",
-                extra={
-                    'user_id': user_id,
-                    'action': action,
-                    'context': context or {}
-                }
-            )
+        # Called from every handler: skip work when disabled and leave the
+        # message interpolation to the listener thread
+        logger = self._user_action_logger
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info(
+            "User %s performed action: %s", user_id, action,
+            extra={
+                'user_id': user_id,
+                'action': action,
+                'context': context or {}
+            }
+        )
     
     def log_error(self, error: Exception, context: Optional[Dict[str, Any]] = None, 
                   user_id: Optional[int] = None) -> None:
@@ -214,19 +321,19 @@ class LoggingSystem:
             context: Additional context data
             user_id: User ID if error is user-related
         """
-        import traceback
+        logger = self._error_logger
+        if not logger.isEnabledFor(logging.ERROR):
+            return
         
-        logger = self.loggers.get('errors')
-        if logger:
-            logger.error(
-                f"Error occurred: {str(error)}",
-                extra={
-                    'user_id': user_id,
-                    'error_type': type(error).__name__,
-                    'context': context or {},
-                    'stack_trace': traceback.format_exc()
-                }
-            )
+        logger.error(
+            f"Error occurred: {str(error)}",
+            exc_info=(type(error), error, error.__traceback__),
+            extra={
+                'user_id': user_id,
+                'error_type': type(error).__name__,
+                'context': context or {}
+            }
+        )
     
     def log_security_event(self, event_type: str, description: str, user_id: int,
                           severity: str = 'medium', additional_data: Optional[Dict[str, Any]] = None) -> None:
@@ -240,27 +347,34 @@ class LoggingSystem:
             severity: Event severity (low, medium, high, critical)
             additional_data: Additional event data
         """
-        logger = self.loggers.get('security')
-        if logger:
-            log_level = {
-                'low': logging.INFO,
-                'medium': logging.WARNING,
-                'high': logging.ERROR,
-                'critical': logging.CRITICAL
-            }.get(severity.lower(), logging.WARNING)
-            
-            logger.log(
-                log_level,
-                f"Security event: {event_type} - {description}",
-                extra={
-                    'user_id': user_id,
-                    'action': event_type,
-                    'context': {
-                        'severity': severity,
-                        'additional_data': additional_data or {}
-                    }
+        log_level = {
+            'low': logging.INFO,
+            'medium': logging.WARNING,
+            'high': logging.ERROR,
+            'critical': logging.CRITICAL
+        }.get(severity.lower(), logging.WARNING)
+        
+        self._security_logger.log(
+            log_level,
+            f"Security event: {event_type} - {description}",
+            extra={
+                'user_id': user_id,
+                'action': event_type,
+                'context': {
+                    'severity': severity,
+                    'additional_data': additional_data or {}
                 }
-            )
+            }
+        )
+    
+    def is_info_enabled(self) -> bool:
+        """
+        Check whether log_info messages would be emitted.
+        
+        Returns:
+            True if the main logger handles INFO records
+        """
+        return self._main_logger.isEnabledFor(logging.INFO)
     
     def log_info(self, message: str, user_id: Optional[int] = None, 
                  context: Optional[Dict[str, Any]] = None) -> None:
@@ -272,15 +386,13 @@ class LoggingSystem:
             user_id: User ID if applicable
             context: Additional context
         """
-        logger = self.loggers.get('main')
-        if logger:
-            logger.info(
-                message,
-                extra={
-                    'user_id': user_id,
-                    'context': context or {}
-                }
-            )
+        self._main_logger.info(
+            message,
+            extra={
+                'user_id': user_id,
+                'context': context or {}
+            }
+        )
     
     def log_warning(self, message: str, user_id: Optional[int] = None,
                    context: Optional[Dict[str, Any]] = None) -> None:
@@ -292,22 +404,21 @@ class LoggingSystem:
             user_id: User ID if applicable
             context: Additional context
         """
-        logger = self.loggers.get('main')
-        if logger:
-            logger.warning(
-                message,
-                extra={
-                    'user_id': user_id,
-                    'context': context or {}
-                }
-            )
+        self._main_logger.warning(
+            message,
+            extra={
+                'user_id': user_id,
+                'context': context or {}
+            }
+        )
     
     def rotate_logs(self) -> None:
         """Manually trigger log rotation for all handlers."""
-        for logger in self.loggers.values():
-            for handler in logger.handlers:
-                if isinstance(handler, logging.handlers.RotatingFileHandler):
-                    handler.doRollover()
+        for handlers in self._handler_routes.values():
+            for handler in handlers:
+                handler.flush()
+        for file_handler in self._file_handlers:
+            file_handler.doRollover()
     
     def get_logger(self, name: str) -> Optional[logging.Logger]:
         """
@@ -328,18 +439,21 @@ class LoggingSystem:
         Args:
             days_to_keep: Number of days to keep log files
         """
-        import glob
         from datetime import timedelta
         
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+        cutoff = (datetime.now() - timedelta(days=days_to_keep)).timestamp()
         log_dir = Path(self.config.file_path).parent
         
-        # Find all log files with backup extensions
-        for log_file in glob.glob(str(log_dir / "*.log*")):
-            try:
-                file_path = Path(log_file)
-                if file_path.stat().st_mtime < cutoff_date.timestamp():
-                    file_path.unlink()
-                    self.log_info(f"Deleted old log file: {log_file}")
-            except Exception as e:
-                self.log_error(e, context={'action': 'cleanup_old_logs', 'file': log_file})
\ No newline at end of file
+        # Find all log files with backup extensions (same set as "*.log*");
+        # DirEntry.stat() reuses the data from the directory scan where possible
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith('.') or '.log' not in name:
+                    continue
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        self.log_info(f"Deleted old log file: {entry.path}")
+                except Exception as e:
+                    self.log_error(e, context={'action': 'cleanup_old_logs', 'file': entry.path})
\ No newline at end of file
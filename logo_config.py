@@ -1,12 +1,17 @@
 # Configuración de Logo para el Bot de Testosterona
 # Modifica esta variable para cambiar el logo en todo el bot
 
+from functools import lru_cache
+
+# Línea decorativa bajo logos y títulos
+BORDER = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
+
 # Opciones de logo disponibles:
 LOGOS = {
-    "simple": "🧬 **BOT DE TESTOSTERONA** 🧬\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
-    "medico": "⚕️ **BOT DE TESTOSTERONA** ⚕️\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
-    "testosterona": "🧪 **BOT DE TESTOSTERONA** 🧪\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
-    "fuerza": "💪 **BOT DE TESTOSTERONA** 💪\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━",
+    "simple": "🧬 **BOT DE TESTOSTERONA** 🧬\n" + BORDER,
+    "medico": "⚕️ **BOT DE TESTOSTERONA** ⚕️\n" + BORDER,
+    "testosterona": "🧪 **BOT DE TESTOSTERONA** 🧪\n" + BORDER,
+    "fuerza": "💪 **BOT DE TESTOSTERONA** 💪\n" + BORDER,
     "ascii_simple": """    ╔══════════════════════════════╗
     ║    🧬 BOT DE TESTOSTERONA 🧬   ║
     ║    Tu Asistente Médico Digital ║
@@ -36,17 +41,24 @@ LOGOS = {
 # Logo actual (cambia esta variable para cambiar el logo)
 CURRENT_LOGO = "simple"
 
+@lru_cache(maxsize=1)
 def get_logo():
     """Retorna el logo actual configurado"""
     return LOGOS.get(CURRENT_LOGO, LOGOS["simple"])
 
+@lru_cache(maxsize=64)
 def get_logo_with_title(title=""):
     """Retorna el logo con un título opcional"""
     logo = get_logo()
     if title:
-        return f"{logo}\n{title}\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
+        return f"{logo}\n{title}\n{BORDER}"
     return logo
 
+def reset_logo_cache():
+    """Limpia los logos cacheados (llamar tras cambiar CURRENT_LOGO o LOGOS)"""
+    get_logo.cache_clear()
+    get_logo_with_title.cache_clear()
+
 # Ejemplo de uso:
 if __name__ == "__main__":
     print("Logo actual:")
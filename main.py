@@ -5,23 +5,43 @@ Bot de Telegram para una estimación de niveles de testosterona.
 Utiliza cuestionarios médicos ADAM y AMS, además de factores de estilo de vida.
 """
 
+import asyncio
+import html
 import logging
+import operator
+import re
 import sys
+import time
 from datetime import datetime
+from typing import Dict, Optional
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
+    Defaults,
     MessageHandler,
     CallbackQueryHandler,
     filters,
 )
 from config_manager import ConfigManager, ConfigurationError
 from logging_system import LoggingSystem
-from error_handler import ErrorHandler, ErrorContext, ErrorType
-from conversation_handler import EnhancedConversationHandler, ConversationState
+from error_handler import ErrorHandler, ErrorContext, RetryConfig
+from conversation_handler import (
+    TIMEOUT_REMINDER_TEXT,
+    ConversationState,
+    EnhancedConversationHandler,
+    SessionState,
+)
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Global instances (will be initialized in main)
 logging_system = None
@@ -29,6 +49,56 @@ error_handler = None
 conversation_handler = None
 logger = logging.getLogger(__name__)
 
+
+def _reply_text_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs):
+    """Envía una respuesta directa cuando no hay error_handler."""
+    return update.message.reply_text(text, **kwargs)
+
+
+def _session(context: ContextTypes.DEFAULT_TYPE) -> SessionState:
+    """Estado del cuestionario del usuario, creado vacío si aún no existe."""
+    session = context.user_data.get("s")
+    if session is None:
+        session = context.user_data["s"] = SessionState()
+    return session
+
+
+# Función de envío usada por los handlers; main() la enlaza a
+# error_handler.safe_send_message una vez inicializado
+_send = _reply_text_fallback
+
+
+def _send_results_once(bot, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup):
+    """Envía el mensaje de resultados en una sola llamada a la API."""
+    return bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+
+
+# Envío de resultados; main() lo envuelve una vez con error_handler.with_retry
+_send_results = _send_results_once
+
+def _uid(update: Update) -> Optional[int]:
+    """ID del usuario que originó el update, o None si no hay usuario."""
+    user = update.effective_user
+    return user.id if user else None
+
+
+def _cid(update: Update) -> Optional[int]:
+    """ID del chat del update, o None si no hay chat."""
+    chat = update.effective_chat
+    return chat.id if chat else None
+
+
+def _make_ctx(update: Update, user_id: Optional[int], function_name: str,
+              additional_data: Optional[dict] = None) -> ErrorContext:
+    """ErrorContext para el update, construido solo en la rama de error."""
+    return ErrorContext(
+        user_id=user_id,
+        chat_id=_cid(update),
+        function_name=function_name,
+        additional_data=additional_data
+    )
+
+
 # --- Definición de Estados para la Conversación ---
 # Usamos números para definir cada paso del flujo de la conversación.
 (
@@ -40,9 +110,10 @@ logger = logging.getLogger(__name__)
 ) = range(5)
 
 # --- Preguntas de los Cuestionarios ---
+# Tuplas inmutables de cadenas internadas: se comparten con todo el proceso.
 
 # Cuestionario ADAM (Androgen Deficiency in Aging Males)
-ADAM_QUESTIONS = [
+ADAM_QUESTIONS = tuple(sys.intern(q) for q in [
     "1/10: ¿Ha disminuido su libido (deseo sexual)?",
     "2/10: ¿Siente una falta de energía?",
     "3/10: ¿Ha perdido fuerza o resistencia?",
@@ -53,10 +124,10 @@ ADAM_QUESTIONS = [
     "8/10: ¿Ha notado un deterioro reciente en su capacidad para practicar deportes?",
     "9/10: ¿Se queda dormido después de cenar?",
     "10/10: ¿Ha disminuido recientemente su rendimiento en el trabajo?",
-]
+])
 
 # Cuestionario AMS (Aging Male's Symptoms)
-AMS_QUESTIONS = [
+AMS_QUESTIONS = tuple(sys.intern(q) for q in [
     "1/17: Disminución del deseo/apetito sexual.",
     "2/17: Sensación de agotamiento físico/falta de vitalidad.",
     "3/17: Disminución de la fuerza muscular.",
@@ -74,17 +145,345 @@ AMS_QUESTIONS = [
     "15/17: Sensación de que 'ya ha pasado lo mejor'.",
     "16/17: Sensación de estar 'quemado', de haber llegado al límite.",
     "17/17: Tristeza o desánimo.",
-]
+])
 
 # Preguntas sobre Estilo de Vida
-LIFESTYLE_QUESTIONS = [
+LIFESTYLE_QUESTIONS = tuple(sys.intern(q) for q in [
     "1/6: ¿Cuál es tu edad?",
     "2/6: ¿Cuál es tu porcentaje de grasa corporal aproximado? (Si no lo sabes, introduce un estimado. Ej: 15)",
     "3/6: En una escala de 1 a 5, ¿cómo calificarías la calidad de tu sueño? (1=Muy mala, 5=Excelente)",
     "4/6: En una escala de 1 a 5, ¿cómo calificarías tu nivel de estrés diario? (1=Muy bajo, 5=Muy alto)",
     "5/6: ¿Cuántas veces por semana realizas ejercicio de fuerza (pesas, calistenia, etc.)?",
     "6/6: ¿Consumes alcohol o tabaco de forma regular?",
-]
+])
+
+TOTAL_QUESTIONS = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
+
+
+# --- Cabeceras de progreso precalculadas ---
+# El progreso depende solo de la sección y del índice de la pregunta, así que
+# se construye una vez al importar el módulo.
+
+# Las 11 barras de progreso posibles (0-100% en pasos de 10)
+_BARS = tuple("█" * i + "░" * (10 - i) for i in range(11))
+
+
+def _progress_header(section_title: str, index: int, section_total: int, answered_before: int) -> str:
+    """Construye las líneas de progreso general y sección para una pregunta."""
+    overall_progress = ((answered_before + index) / TOTAL_QUESTIONS) * 100
+    progress_bar = _BARS[int(overall_progress) // 10]
+    return (
+        f"📊 <b>Progreso General:</b> {int(overall_progress)}% [{progress_bar}]\n"
+        f"📋 <b>Sección:</b> {section_title} - Pregunta {index + 1} de {section_total}\n"
+    )
+
+
+PROGRESS_HEADERS = {
+    "ADAM": [
+        _progress_header("ADAM", i, len(ADAM_QUESTIONS), 0)
+        for i in range(len(ADAM_QUESTIONS))
+    ],
+    "AMS": [
+        _progress_header("AMS", i, len(AMS_QUESTIONS), len(ADAM_QUESTIONS))
+        for i in range(len(AMS_QUESTIONS))
+    ],
+    "LIFESTYLE": [
+        _progress_header("Estilo de Vida", i, len(LIFESTYLE_QUESTIONS), len(ADAM_QUESTIONS) + len(AMS_QUESTIONS))
+        for i in range(len(LIFESTYLE_QUESTIONS))
+    ],
+}
+
+# Cabecera + pregunta, listo para enviar
+PROGRESS_TEXTS = {
+    section: [header + "\n" + question for header, question in zip(PROGRESS_HEADERS[section], questions)]
+    for section, questions in (("ADAM", ADAM_QUESTIONS), ("AMS", AMS_QUESTIONS), ("LIFESTYLE", LIFESTYLE_QUESTIONS))
+}
+
+
+# --- Teclados fijos ---
+# Son inmutables e iguales para todos los usuarios; se construyen una sola vez.
+
+_REVIEW_LABEL = "📝 Revisar respuesta anterior"
+_MODIFY_LABEL = "🔄 Modificar última respuesta"
+
+KB_START = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("✅ Sí, comenzar", callback_data="start_yes"),
+        InlineKeyboardButton("❌ No, ahora no", callback_data="start_no"),
+    ]
+])
+KB_RECOVERY = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("✅ Continuar", callback_data="continue_yes"),
+        InlineKeyboardButton("🔄 Empezar de nuevo", callback_data="start_fresh"),
+    ]
+])
+KB_ADAM_ANSWER = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")]
+])
+KB_ADAM = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")],
+    [InlineKeyboardButton(_REVIEW_LABEL, callback_data="review_adam")],
+])
+KB_AMS_REVIEW = InlineKeyboardMarkup([
+    [InlineKeyboardButton(_REVIEW_LABEL, callback_data="review_ams")]
+])
+KB_LIFESTYLE_ANSWER = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Sí", callback_data="ls_yes"), InlineKeyboardButton("No", callback_data="ls_no")]
+])
+KB_LIFESTYLE_REVIEW = InlineKeyboardMarkup([
+    [InlineKeyboardButton(_REVIEW_LABEL, callback_data="review_lifestyle")]
+])
+KB_LIFESTYLE_FINAL = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Sí", callback_data="ls_yes"), InlineKeyboardButton("No", callback_data="ls_no")],
+    [InlineKeyboardButton(_REVIEW_LABEL, callback_data="review_lifestyle")],
+])
+KB_REVIEW_ADAM = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Continuar", callback_data="continue_adam")],
+    [InlineKeyboardButton(_MODIFY_LABEL, callback_data="modify_adam_last")],
+    [InlineKeyboardButton("🔄 Reiniciar ADAM", callback_data="restart_adam")],
+])
+KB_REVIEW_AMS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Continuar", callback_data="continue_ams")],
+    [InlineKeyboardButton(_MODIFY_LABEL, callback_data="modify_ams_last")],
+    [InlineKeyboardButton("🔄 Reiniciar AMS", callback_data="restart_ams")],
+])
+KB_REVIEW_LIFESTYLE = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Continuar", callback_data="continue_lifestyle")],
+    [InlineKeyboardButton(_MODIFY_LABEL, callback_data="modify_lifestyle_last")],
+    [InlineKeyboardButton("🔄 Reiniciar Estilo de Vida", callback_data="restart_lifestyle")],
+])
+KB_RESULTS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💾 Guardar resultados", callback_data="save_results")],
+    [InlineKeyboardButton("📤 Compartir resultados", callback_data="share_results")],
+    [InlineKeyboardButton("📊 Ver detalles", callback_data="detailed_results")],
+    [InlineKeyboardButton("🔄 Nuevo cuestionario", callback_data="new_questionnaire")],
+])
+
+
+# --- Textos fijos de /start ---
+
+_WELCOME_TEXT = (
+    "🧬 <b>BOT DE TESTOSTERONA</b> 🧬\n"
+    "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+    "Hola 👋 Soy tu asistente médico digital.\n\n"
+    "Te haré una serie de preguntas basadas en cuestionarios médicos (ADAM + AMS) y sobre tu estilo de vida para darte una estimación de tu nivel de testosterona.\n\n"
+    "⚠️ <b>Importante:</b> Esto NO reemplaza un análisis de sangre ni una consulta médica. Es solo una herramienta orientativa.\n\n"
+    "¿Quieres comenzar?"
+)
+
+_PRIVATE_ONLY_TEXT = (
+    "Para proteger tu privacidad, solo respondo en chats privados. "
+    "Por favor, envíame /start en un chat conmigo."
+)
+
+
+# --- Textos fijos de /help e /info ---
+
+_HELP_TEXT = (
+    "🤖 <b>Comandos disponibles:</b>\n\n"
+    "/start - Iniciar o continuar el cuestionario\n"
+    "/status - Ver tu progreso actual\n"
+    "/info - Información sobre los cuestionarios\n"
+    "/reset - Reiniciar el cuestionario actual\n"
+    "/cancel - Cancelar el cuestionario\n"
+    "/help - Mostrar esta ayuda\n\n"
+    "💡 <b>Consejos:</b>\n"
+    "• El bot guarda tu progreso automáticamente\n"
+    "• Puedes continuar donde lo dejaste hasta 24 horas después\n"
+    "• Solo funciona en chats privados para proteger tu privacidad"
+)
+
+_INFO_TEXT = (
+    "📋 <b>Información sobre los cuestionarios:</b>\n\n"
+    "<b>Cuestionario ADAM (10 preguntas)</b>\n"
+    "• Androgen Deficiency in Aging Males\n"
+    "• Preguntas de Sí/No sobre síntomas\n"
+    "• Detecta posible déficit de testosterona\n\n"
+    "<b>Cuestionario AMS (17 preguntas)</b>\n"
+    "• Aging Male's Symptoms\n"
+    "• Escala de 1-5 por severidad de síntomas\n"
+    "• Evaluación más detallada\n\n"
+    "<b>Preguntas de Estilo de Vida (6 preguntas)</b>\n"
+    "• Edad, grasa corporal, sueño, estrés\n"
+    "• Ejercicio y hábitos\n"
+    "• Factores que afectan la testosterona\n\n"
+    "⚠️ <b>Importante:</b> Este es solo un cuestionario orientativo.\n"
+    "NO reemplaza un análisis de sangre ni consulta médica."
+)
+
+
+# --- Plantillas de resultados (se rellenan con format_map sobre final_results) ---
+
+_FINAL_TMPL = (
+    "🧬 <b>BOT DE TESTOSTERONA</b> 🧬\n"
+    "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+    "📝 <b>RESULTADOS DE TU EVALUACIÓN</b>\n"
+    "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+    "✅ <b>Resultado ADAM:</b> {adam_result}\n"
+    "📊 <b>Escala AMS:</b> {ams_result}\n"
+    "🏃‍♂️ <b>Estilo de Vida:</b> {lifestyle_summary}\n\n"
+    "👉 <b>Recomendación:</b>\n"
+    "Recuerda que esto es solo una estimación. Si tus resultados indican un posible déficit o síntomas moderados/severos, considera consultar a un médico especialista (urólogo o endocrinólogo) para un diagnóstico preciso a través de un análisis de sangre.\n\n"
+    "Para volver a empezar, escribe /start."
+)
+
+_SAVED_TMPL = (
+    "💾 <b>Resultados guardados:</b>\n\n"
+    "🧪 <b>Resultados del Cuestionario de Testosterona</b>\n"
+    "📅 Fecha: {completion_date}\n\n"
+    "<b>ADAM:</b> {adam_result}\n"
+    "<b>AMS:</b> {ams_result}\n"
+    "<b>Estilo de Vida:</b> {lifestyle_summary}\n\n"
+    "<b>Detalles:</b>\n"
+    "• Respuestas ADAM 'Sí': {adam_yes_count}/10\n"
+    "• Puntuación AMS: {ams_score} ({ams_interpretation})\n"
+    "• Factores de riesgo identificados: {lifestyle_factors_count}\n\n"
+    "⚠️ Estos resultados son solo orientativos. Consulta a un médico para un diagnóstico preciso.\n\n"
+    "Puedes copiar este texto para guardarlo en tus notas personales."
+)
+
+_SHARE_TMPL = (
+    "📤 <b>Texto para compartir:</b>\n\n"
+    "🧪 <b>Resumen de Evaluación de Testosterona</b>\n\n"
+    "<b>ADAM:</b> {adam_result}\n"
+    "<b>AMS:</b> {ams_interpretation} ({ams_score} puntos)\n"
+    "<b>Factores de estilo de vida:</b> {lifestyle_factors_count} identificados\n\n"
+    "⚠️ Resultados orientativos. Consulta médica recomendada.\n\n"
+    "🤖 Evaluación realizada con el Bot de Testosterona\n\n"
+    "Puedes copiar este texto para compartir tus resultados de forma anónima."
+)
+
+_DETAILED_TMPL = (
+    "📊 <b>Análisis Detallado Completo</b>\n\n"
+    "<b>📋 Cuestionario ADAM (Androgen Deficiency in Aging Males):</b>\n"
+    "• Respuestas 'Sí': {adam_yes_count}/10\n"
+    "• Resultado: {adam_result}\n"
+    "• Criterio: Posible déficit si pregunta 1 o 7 es 'Sí', o 3+ respuestas 'Sí'\n\n"
+    "<b>📈 Escala AMS (Aging Male's Symptoms):</b>\n"
+    "• Puntuación total: {ams_score}/85 puntos\n"
+    "• Interpretación: {ams_interpretation}\n"
+    "• Rangos de interpretación:\n"
+    "  - ≤26: No significativo\n"
+    "  - 27-36: Leve\n"
+    "  - 37-49: Moderado\n"
+    "  - ≥50: Severo\n\n"
+    "<b>🏃‍♂️ Factores de Estilo de Vida Analizados:</b>\n"
+    "{lifestyle_factors_text}\n"
+    "\n<b>💡 Recomendaciones Específicas:</b>\n"
+    "• 🏥 Consulta médica si hay síntomas moderados/severos\n"
+    "• 🧪 Análisis de sangre (testosterona total y libre)\n"
+    "• 💪 Ejercicio de fuerza regular (3-4 veces/semana)\n"
+    "• 😴 Mejorar calidad del sueño (7-9 horas)\n"
+    "• 🍎 Alimentación equilibrada y reducción de estrés\n"
+    "• 🚫 Evitar alcohol y tabaco en exceso\n\n"
+    "<b>⚠️ Importante:</b> Estos resultados son orientativos. Solo un análisis de sangre y consulta médica pueden confirmar un diagnóstico real."
+)
+
+_NO_LIFESTYLE_FACTORS_TEXT = "• ✅ No se identificaron factores de riesgo significativos"
+
+
+# Campos de progreso que cambia cada respuesta; save_progress solo copia estos
+_ADAM_FIELDS = ("adam_mask", "adam_count")
+_AMS_FIELDS = ("ams_score", "ams_question_index", "ams_scores")
+_LIFESTYLE_FIELDS = ("lifestyle_answers", "lifestyle_question_index")
+
+
+# --- Validadores de respuestas de texto ---
+# Cada validador devuelve (ok, valor, mensaje_de_error).
+
+def _v_int_range(user_input: str, low: int, high: Optional[int], error_msg: str):
+    """Valida un entero en [low, high]; high=None significa sin límite superior."""
+    try:
+        value = int(user_input)
+    except (ValueError, TypeError):
+        return False, None, error_msg
+    if value < low or (high is not None and value > high):
+        return False, None, error_msg
+    return True, value, None
+
+
+def _v_age(user_input: str):
+    return _v_int_range(user_input, 1, 120, "Por favor, introduce una edad válida (18-120 años).")
+
+
+def _v_fat(user_input: str):
+    return _v_int_range(user_input, 0, 100, "Por favor, introduce un porcentaje de grasa corporal válido (0-100%).")
+
+
+# Respuestas AMS válidas; el filtro se compila una vez y PTB lo evalúa antes
+# de llamar al handler
+AMS_SCORE_FILTER = filters.TEXT & filters.Regex(r"^\s*[1-5]\s*$")
+
+
+def _v_1to5(user_input: str):
+    return _v_int_range(user_input, 1, 5, "Por favor, introduce un número del 1 al 5.")
+
+
+def _v_nonneg_int(user_input: str):
+    return _v_int_range(user_input, 0, None, "Por favor, introduce un número válido de veces por semana (0 o más).")
+
+
+_YES_TOKENS = frozenset({"sí", "si", "s", "yes", "y"})
+_NO_TOKENS = frozenset({"no", "n"})
+
+
+def _v_yesno(user_input: str):
+    token = user_input.strip().lower()
+    if token in _YES_TOKENS:
+        return True, True, None
+    if token in _NO_TOKENS:
+        return True, False, None
+    return False, None, "Por favor, responde 'sí' o 'no'."
+
+
+# Indexado por lifestyle_question_index: edad, grasa corporal, sueño, estrés,
+# ejercicio y alcohol/tabaco
+LIFESTYLE_VALIDATORS = (_v_age, _v_fat, _v_1to5, _v_1to5, _v_nonneg_int, _v_yesno)
+
+# Comienzo de cada línea de la revisión ADAM: "N. <pregunta recortada>... → "
+_ADAM_REVIEW_PREFIXES = tuple(f"{i + 1}. {question[:50]}... → " for i, question in enumerate(ADAM_QUESTIONS))
+
+# Línea de revisión por pregunta de estilo de vida; None = respuesta Sí/No
+_LIFESTYLE_REVIEW_FMTS = (
+    "Edad: {} años\n",
+    "Grasa corporal: {}%\n",
+    "Calidad del sueño: {}/5\n",
+    "Nivel de estrés: {}/5\n",
+    "Ejercicio por semana: {} veces\n",
+    None,
+)
+
+# Factores de riesgo: (clave, valor por defecto, comparación, umbral, etiqueta)
+_LIFESTYLE_RULES = (
+    ("q2", 15, operator.gt, 20, "Grasa corporal elevada"),
+    ("q3", 3, operator.le, 2, "Mala calidad del sueño"),
+    ("q4", 3, operator.ge, 4, "Alto nivel de estrés"),
+    ("q5", 2, operator.lt, 2, "Poco ejercicio de fuerza"),
+    ("q6", False, operator.ne, False, "Consumo regular de alcohol/tabaco"),
+)
+
+
+async def _edit_query_message(query, text: str, reply_markup: InlineKeyboardMarkup) -> None:
+    """
+    Edita el mensaje del callback evitando llamadas innecesarias a la API.
+    
+    Si el mensaje ya muestra el mismo texto solo se envía el teclado, y si el
+    teclado también coincide no se hace ninguna llamada.
+    """
+    message = query.message
+    # Los textos se envían como HTML; text_html reconstruye las etiquetas <b>
+    # pero también escapa comillas y apóstrofos, así que se comparan sin escapar
+    if message is not None and html.unescape(message.text_html) == html.unescape(text):
+        if message.reply_markup != reply_markup:
+            await query.edit_message_reply_markup(reply_markup=reply_markup)
+        return
+    try:
+        await query.edit_message_text(text=text, reply_markup=reply_markup)
+    except BadRequest as e:
+        # El mensaje ya mostraba este contenido: no es un error
+        if "message is not modified" not in str(e).lower():
+            raise
 
 
 # --- Funciones del Bot ---
@@ -94,7 +493,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     Inicia la conversación. Se activa con /start.
     Saluda y pregunta al usuario si quiere comenzar el cuestionario.
     """
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
     
     try:
         # Log user action
@@ -103,83 +502,78 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         
         # Importante: El bot solo funciona en chats privados para proteger la privacidad.
         if update.message.chat.type != 'private':
-            message = "Para proteger tu privacidad, solo respondo en chats privados. Por favor, envíame /start en un chat conmigo."
-            if error_handler:
-                await error_handler.safe_send_message(update, context, message)
-            else:
-                await update.message.reply_text(message)
+            await _send(update, context, _PRIVATE_ONLY_TEXT)
             return ConversationHandler.END
 
         # Check for existing progress and offer recovery
-        if conversation_handler and conversation_handler.has_active_session(user_id):
-            recovery_message = conversation_handler.get_recovery_message(user_id)
+        saved_progress = conversation_handler.load_progress(user_id) if conversation_handler else None
+        if saved_progress:
+            recovery_message = conversation_handler.get_recovery_message(user_id, saved_progress)
             if recovery_message:
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Continuar", callback_data="continue_yes"),
-                        InlineKeyboardButton("🔄 Empezar de nuevo", callback_data="start_fresh"),
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                if error_handler:
-                    await error_handler.safe_send_message(update, context, recovery_message, reply_markup=reply_markup)
-                else:
-                    await update.message.reply_text(recovery_message, reply_markup=reply_markup)
+                await _send(update, context, recovery_message, reply_markup=KB_RECOVERY)
                 
                 return STATE_START
 
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Sí, comenzar", callback_data="start_yes"),
-                InlineKeyboardButton("❌ No, ahora no", callback_data="start_no"),
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        message = (
-            "🧬 **BOT DE TESTOSTERONA** 🧬\n"
-            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-            "Hola 👋 Soy tu asistente médico digital.\n\n"
-            "Te haré una serie de preguntas basadas en cuestionarios médicos (ADAM + AMS) y sobre tu estilo de vida para darte una estimación de tu nivel de testosterona.\n\n"
-            "⚠️ **Importante:** Esto NO reemplaza un análisis de sangre ni una consulta médica. Es solo una herramienta orientativa.\n\n"
-            "¿Quieres comenzar?"
-        )
-        
-        if error_handler:
-            success = await error_handler.safe_send_message(update, context, message, reply_markup=reply_markup)
-            if not success:
-                # Fallback without markup
-                await error_handler.safe_send_message(update, context, message)
-        else:
-            await update.message.reply_text(message, reply_markup=reply_markup)
+        success = await _send(update, context, _WELCOME_TEXT, reply_markup=KB_START)
+        if not success:
+            # Fallback without markup
+            await _send(update, context, _WELCOME_TEXT)
         
         return STATE_START
         
     except Exception as e:
         if error_handler and logging_system:
-            error_context = ErrorContext(
-                user_id=user_id,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                function_name="start"
-            )
+            error_context = _make_ctx(update, user_id, "start")
             recovery_action, user_message = await error_handler.handle_error(e, error_context)
             
             if user_message:
                 await error_handler.safe_send_message(update, context, user_message)
         else:
-            logger.error(f"Error in start function: {e}")
+            logger.error("Error in start function: %s", e)
             
         return ConversationHandler.END
 
 
+def _resume_adam(progress):
+    """Pregunta ADAM pendiente como (texto, teclado, estado), o None si no queda ninguna."""
+    index = progress.adam_count
+    if index < len(ADAM_QUESTIONS):
+        return ADAM_QUESTIONS[index], KB_ADAM_ANSWER, STATE_ADAM
+    return None
+
+
+def _resume_ams(progress):
+    """Pregunta AMS pendiente como (texto, teclado, estado), o None si no queda ninguna."""
+    index = progress.ams_question_index
+    if index < len(AMS_QUESTIONS):
+        return AMS_QUESTIONS[index], None, STATE_AMS
+    return None
+
+
+def _resume_lifestyle(progress):
+    """Pregunta de estilo de vida pendiente como (texto, teclado, estado), o None si no queda ninguna."""
+    index = progress.lifestyle_question_index
+    if index < len(LIFESTYLE_QUESTIONS):
+        # La última pregunta se responde con botones
+        reply_markup = KB_LIFESTYLE_ANSWER if index == 5 else None
+        return LIFESTYLE_QUESTIONS[index], reply_markup, STATE_LIFESTYLE
+    return None
+
+
+RESUME_DISPATCHERS = {
+    ConversationState.ADAM: _resume_adam,
+    ConversationState.AMS: _resume_ams,
+    ConversationState.LIFESTYLE: _resume_lifestyle,
+}
+
+
 async def start_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Maneja la respuesta del botón 'Sí' o 'No' del inicio.
     """
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
 
     if query.data == "continue_yes":
         # User wants to continue from where they left off
@@ -190,51 +584,23 @@ async def start_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
                 conversation_handler.restore_context_from_progress(context, progress)
                 
                 # Show current progress
-                progress_message = conversation_handler.show_progress(user_id)
+                progress_message = conversation_handler.show_progress(user_id, progress)
                 if progress_message:
-                    await query.edit_message_text(text=progress_message)
-                    await context.bot.send_message(
-                        chat_id=update.effective_chat.id,
-                        text="Continuando desde donde lo dejaste..."
+                    await query.edit_message_text(
+                        text=f"{progress_message}\n\nContinuando desde donde lo dejaste..."
                     )
                 
                 # Return to the appropriate state
-                if progress.current_state == ConversationState.ADAM:
-                    current_question_index = len(progress.adam_answers)
-                    if current_question_index < len(ADAM_QUESTIONS):
-                        keyboard = [[InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")]]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=ADAM_QUESTIONS[current_question_index],
-                            reply_markup=reply_markup
-                        )
-                        return STATE_ADAM
-                elif progress.current_state == ConversationState.AMS:
-                    current_question_index = progress.ams_question_index
-                    if current_question_index < len(AMS_QUESTIONS):
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=AMS_QUESTIONS[current_question_index]
-                        )
-                        return STATE_AMS
-                elif progress.current_state == ConversationState.LIFESTYLE:
-                    current_question_index = progress.lifestyle_question_index
-                    if current_question_index < len(LIFESTYLE_QUESTIONS):
-                        if current_question_index == 5:  # Last question with buttons
-                            keyboard = [[InlineKeyboardButton("Sí", callback_data="ls_yes"), InlineKeyboardButton("No", callback_data="ls_no")]]
-                            reply_markup = InlineKeyboardMarkup(keyboard)
-                            await context.bot.send_message(
-                                chat_id=update.effective_chat.id,
-                                text=LIFESTYLE_QUESTIONS[current_question_index],
-                                reply_markup=reply_markup
-                            )
-                        else:
-                            await context.bot.send_message(
-                                chat_id=update.effective_chat.id,
-                                text=LIFESTYLE_QUESTIONS[current_question_index]
-                            )
-                        return STATE_LIFESTYLE
+                resume = RESUME_DISPATCHERS.get(progress.current_state)
+                resumed = resume(progress) if resume else None
+                if resumed:
+                    text, reply_markup, next_state = resumed
+                    await context.bot.send_message(
+                        chat_id=update.effective_chat.id,
+                        text=text,
+                        reply_markup=reply_markup
+                    )
+                    return next_state
         
         # Fallback to starting fresh if recovery fails
         query.data = "start_yes"
@@ -247,19 +613,14 @@ async def start_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     if query.data == "start_yes":
         # Inicializa las variables para guardar las respuestas del usuario.
-        context.user_data["adam_answers"] = []
-        context.user_data["ams_score"] = 0
-        context.user_data["ams_question_index"] = 0
-        context.user_data["lifestyle_answers"] = {}
-        context.user_data["lifestyle_question_index"] = 0
+        session = context.user_data["s"] = SessionState()
         
         # Save initial progress
         if conversation_handler:
-            conversation_handler.save_progress(user_id, ConversationState.ADAM, context.user_data)
+            conversation_handler.save_progress(user_id, ConversationState.ADAM, session)
         
         # Pregunta la primera del cuestionario ADAM
-        keyboard = [[InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = KB_ADAM_ANSWER
         
         await query.edit_message_text(text=ADAM_QUESTIONS[0], reply_markup=reply_markup)
         return STATE_ADAM
@@ -274,78 +635,63 @@ async def adam_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     """
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
+    session = _session(context)
 
-    # Guarda la respuesta (True para Sí, False para No)
-    context.user_data["adam_answers"].append(query.data == "adam_yes")
+    # Guarda la respuesta como bit de adam_mask (1 para Sí, 0 para No)
+    current_question_index = session.adam_count
+    session.adam_mask |= (query.data == "adam_yes") << current_question_index
+    current_question_index += 1
+    session.adam_count = current_question_index
     
     # Save progress after each answer
     if conversation_handler:
-        conversation_handler.save_progress(user_id, ConversationState.ADAM, context.user_data)
-    
-    current_question_index = len(context.user_data["adam_answers"])
+        conversation_handler.save_progress(user_id, ConversationState.ADAM, session, fields=_ADAM_FIELDS)
 
     if current_question_index < len(ADAM_QUESTIONS):
         # Si quedan preguntas en ADAM, hace la siguiente.
         # Enhanced progress display with percentage and review option
-        total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-        overall_progress = (current_question_index / total_questions) * 100
-        
-        keyboard = [
-            [InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")],
-            [InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_adam")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = KB_ADAM
         
         # Enhanced progress display
-        progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-        progress_text = (
-            f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-            f"📋 **Sección:** ADAM - Pregunta {current_question_index + 1} de {len(ADAM_QUESTIONS)}\n\n"
-            f"{ADAM_QUESTIONS[current_question_index]}"
-        )
-        await query.edit_message_text(text=progress_text, reply_markup=reply_markup)
+        progress_text = PROGRESS_TEXTS["ADAM"][current_question_index]
+        await _edit_query_message(query, progress_text, reply_markup)
         return STATE_ADAM
     else:
         # Si ADAM terminó, empieza con AMS.
         # Initialize AMS tracking
-        context.user_data["ams_question_index"] = 0
+        session.ams_question_index = 0
         
         # Save progress for AMS start
         if conversation_handler:
-            conversation_handler.save_progress(user_id, ConversationState.AMS, context.user_data)
+            conversation_handler.save_progress(user_id, ConversationState.AMS, session, fields=("ams_question_index",))
         
         # Show section completion with summary
-        adam_yes_count = sum(context.user_data["adam_answers"])
+        adam_yes_count = session.adam_mask.bit_count()
         completion_message = (
-            f"✅ **Cuestionario ADAM completado**\n"
+            f"✅ <b>Cuestionario ADAM completado</b>\n"
             f"Respuestas 'Sí': {adam_yes_count}/10\n\n"
             f"Ahora, por favor, responde a las siguientes preguntas puntuando de 1 a 5, donde:\n"
             f"1 = Ninguno\n2 = Leve\n3 = Moderado\n4 = Severo\n5 = Muy severo"
         )
-        await query.edit_message_text(text=completion_message)
-        
-        # Show progress in AMS question with enhanced display
-        total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-        overall_progress = (len(ADAM_QUESTIONS) / total_questions) * 100
-        progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
         
-        progress_text = (
-            f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-            f"📋 **Sección:** AMS - Pregunta 1 de {len(AMS_QUESTIONS)}\n\n"
-            f"{AMS_QUESTIONS[0]}"
-        )
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=progress_text)
+        # Show progress in AMS question with enhanced display, in the same message
+        progress_text = PROGRESS_TEXTS["AMS"][0]
+        await query.edit_message_text(text=f"{completion_message}\n\n{progress_text}")
         return STATE_AMS
 
 
 async def ams_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Maneja las respuestas del cuestionario AMS (puntuación 1-5).
+    
+    Solo recibe mensajes que pasan AMS_SCORE_FILTER; el resto va a
+    ams_invalid_handler.
     """
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
     user_input = update.message.text
-    current_question_index = context.user_data.get("ams_question_index", 0)
+    session = _session(context)
+    current_question_index = session.ams_question_index
 
     try:
         # Log user action
@@ -356,134 +702,66 @@ async def ams_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
                 {"question_index": current_question_index, "response": user_input}
             )
 
-        # Valida que la respuesta sea un número entre 1 y 5.
-        try:
-            score = int(user_input)
-            if not 1 <= score <= 5:
-                raise ValueError("Score out of range")
-        except (ValueError, TypeError) as validation_error:
-            # Enhanced error handling with user-friendly messages and review option
-            keyboard = [[InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_ams")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            error_message = "Por favor, introduce un número válido entre 1 y 5."
-            help_message = "Debe ser un número entero del 1 al 5, donde:\n1 = Ninguno\n2 = Leve\n3 = Moderado\n4 = Severo\n5 = Muy severo"
-            
-            if error_handler:
-                await error_handler.safe_send_message(update, context, error_message)
-                await error_handler.safe_send_message(update, context, help_message)
-                
-                # Enhanced progress display even for errors
-                total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-                answered_questions = len(context.user_data.get("adam_answers", [])) + current_question_index
-                overall_progress = (answered_questions / total_questions) * 100
-                progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-                
-                progress_text = (
-                    f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-                    f"📋 **Sección:** AMS - Pregunta {current_question_index + 1} de {len(AMS_QUESTIONS)}\n\n"
-                    f"{AMS_QUESTIONS[current_question_index]}"
-                )
-                await error_handler.safe_send_message(update, context, progress_text, reply_markup=reply_markup)
-            else:
-                await update.message.reply_text(error_message)
-                await update.message.reply_text(AMS_QUESTIONS[current_question_index])
-            
-            # Log validation error
-            if logging_system:
-                logging_system.log_warning(
-                    f"Invalid AMS response from user {user_id}: {user_input}",
-                    user_id=user_id,
-                    context={"question_index": current_question_index, "input": user_input}
-                )
-            
-            return STATE_AMS
+        # AMS_SCORE_FILTER ya garantiza un número entre 1 y 5.
+        score = int(user_input)
 
         # Suma la puntuación y avanza a la siguiente pregunta.
-        context.user_data["ams_score"] += score
+        session.ams_score += score
+        session.ams_scores.append(score)
         current_question_index += 1
-        context.user_data["ams_question_index"] = current_question_index
+        session.ams_question_index = current_question_index
 
         # Save progress after each answer
         if conversation_handler:
-            conversation_handler.save_progress(user_id, ConversationState.AMS, context.user_data)
+            conversation_handler.save_progress(user_id, ConversationState.AMS, session, fields=_AMS_FIELDS)
 
         if current_question_index < len(AMS_QUESTIONS):
             # Si quedan preguntas en AMS, hace la siguiente.
             # Enhanced progress display with review option
-            total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-            answered_questions = len(context.user_data.get("adam_answers", [])) + current_question_index
-            overall_progress = (answered_questions / total_questions) * 100
-            progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-            
-            keyboard = [[InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_ams")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = KB_AMS_REVIEW
             
             progress_text = (
-                f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-                f"📋 **Sección:** AMS - Pregunta {current_question_index + 1} de {len(AMS_QUESTIONS)}\n"
-                f"💯 **Puntuación actual:** {context.user_data['ams_score']} puntos\n\n"
+                f"{PROGRESS_HEADERS['AMS'][current_question_index]}"
+                f"💯 <b>Puntuación actual:</b> {session.ams_score} puntos\n\n"
                 f"{AMS_QUESTIONS[current_question_index]}"
             )
             
-            if error_handler:
-                await error_handler.safe_send_message(update, context, progress_text, reply_markup=reply_markup)
-            else:
-                await update.message.reply_text(text=progress_text, reply_markup=reply_markup)
+            await _send(update, context, progress_text, reply_markup=reply_markup)
             return STATE_AMS
         else:
             # Si AMS terminó, empieza con Estilo de Vida.
             # Initialize lifestyle tracking
-            context.user_data["lifestyle_question_index"] = 0
+            session.lifestyle_question_index = 0
             
             # Save progress for lifestyle start
             if conversation_handler:
-                conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, context.user_data)
+                conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, session, fields=("lifestyle_question_index",))
             
             # Show section completion with summary
             completion_message = (
-                f"✅ **Cuestionario AMS completado**\n"
-                f"Puntuación total: {context.user_data['ams_score']} puntos\n\n"
+                f"✅ <b>Cuestionario AMS completado</b>\n"
+                f"Puntuación total: {session.ams_score} puntos\n\n"
                 f"Última sección: preguntas sobre tu estilo de vida."
             )
             
             # Enhanced progress display for lifestyle start
-            total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-            answered_questions = len(context.user_data.get("adam_answers", [])) + len(AMS_QUESTIONS)
-            overall_progress = (answered_questions / total_questions) * 100
-            progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-            
-            progress_text = (
-                f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-                f"📋 **Sección:** Estilo de Vida - Pregunta 1 de {len(LIFESTYLE_QUESTIONS)}\n\n"
-                f"{LIFESTYLE_QUESTIONS[0]}"
-            )
+            progress_text = PROGRESS_TEXTS["LIFESTYLE"][0]
             
-            if error_handler:
-                await error_handler.safe_send_message(update, context, completion_message)
-                await error_handler.safe_send_message(update, context, progress_text)
-            else:
-                await update.message.reply_text(completion_message)
-                await update.message.reply_text(text=progress_text)
+            await _send(update, context, f"{completion_message}\n\n{progress_text}")
             
             # Log completion
             if logging_system:
                 logging_system.log_user_action(
                     user_id, 
                     "ams_completed", 
-                    {"total_score": context.user_data["ams_score"]}
+                    {"total_score": session.ams_score}
                 )
             
             return STATE_LIFESTYLE
             
     except Exception as e:
         if error_handler and logging_system:
-            error_context = ErrorContext(
-                user_id=user_id,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                function_name="ams_handler",
-                additional_data={"question_index": current_question_index, "user_input": user_input}
-            )
+            error_context = _make_ctx(update, user_id, "ams_handler", {"question_index": current_question_index, "user_input": user_input})
             recovery_action, user_message = await error_handler.handle_error(e, error_context)
             
             if user_message:
@@ -491,108 +769,95 @@ async def ams_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
                 # Re-ask the current question
                 await error_handler.safe_send_message(update, context, AMS_QUESTIONS[current_question_index])
         else:
-            logger.error(f"Error in ams_handler: {e}")
+            logger.error("Error in ams_handler: %s", e)
             await update.message.reply_text("Ha ocurrido un error. Por favor, intenta de nuevo.")
             
         return STATE_AMS
 
 
+async def ams_invalid_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+    Responde a las respuestas AMS que no son un número del 1 al 5.
+    """
+    user_id = _uid(update)
+    user_input = update.message.text
+    session = _session(context)
+    current_question_index = session.ams_question_index
+
+    if logging_system:
+        logging_system.log_user_action(
+            user_id, 
+            "ams_response", 
+            {"question_index": current_question_index, "response": user_input}
+        )
+
+    # Enhanced error handling with user-friendly messages and review option
+    reply_markup = KB_AMS_REVIEW
+    
+    error_message = "Por favor, introduce un número válido entre 1 y 5."
+    help_message = "Debe ser un número entero del 1 al 5, donde:\n1 = Ninguno\n2 = Leve\n3 = Moderado\n4 = Severo\n5 = Muy severo"
+    
+    # Enhanced progress display even for errors, in a single message
+    progress_text = PROGRESS_TEXTS["AMS"][current_question_index]
+    await _send(update, context, f"{error_message}\n\n{help_message}\n\n{progress_text}", reply_markup=reply_markup)
+    
+    # Log validation error
+    if logging_system:
+        logging_system.log_warning(
+            f"Invalid AMS response from user {user_id}: {user_input}",
+            user_id=user_id,
+            context={"question_index": current_question_index, "input": user_input}
+        )
+    
+    return STATE_AMS
+
+
 async def lifestyle_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Maneja las preguntas sobre estilo de vida, que tienen diferentes tipos de respuesta.
     """
     user_input = update.message.text
-    user_id = update.effective_user.id if update.effective_user else None
-    current_question_index = context.user_data.get("lifestyle_question_index", 0)
+    user_id = _uid(update)
+    session = _session(context)
+    current_question_index = session.lifestyle_question_index
+    if current_question_index >= len(LIFESTYLE_VALIDATORS):
+        # Todas respondidas pero los resultados no llegaron a enviarse
+        # (send_final_results falló): se reintenta en vez de validar
+        return await send_final_results(update, context)
     question_key = f"q{current_question_index}"
 
     # --- Validación de cada pregunta ---
-    try:
-        if current_question_index == 0: # Edad
-            age = int(user_input)
-            if age <= 0 or age > 120: raise ValueError
-            context.user_data["lifestyle_answers"][question_key] = age
-        elif current_question_index == 1: # Grasa corporal
-            fat = int(user_input)
-            if not 0 <= fat <= 100: raise ValueError
-            context.user_data["lifestyle_answers"][question_key] = fat
-        elif current_question_index in [2, 3]: # Sueño y Estrés (1-5)
-            score = int(user_input)
-            if not 1 <= score <= 5: raise ValueError
-            context.user_data["lifestyle_answers"][question_key] = score
-        elif current_question_index == 4: # Ejercicio
-            times = int(user_input)
-            if times < 0: raise ValueError
-            context.user_data["lifestyle_answers"][question_key] = times
-        elif current_question_index == 5: # Alcohol/Tabaco
-            if user_input.lower() not in ['sí', 'si', 'no']: raise ValueError
-            context.user_data["lifestyle_answers"][question_key] = user_input.lower().startswith('s')
-    except (ValueError, TypeError):
+    ok, value, error_msg = LIFESTYLE_VALIDATORS[current_question_index](user_input)
+    if not ok:
         # Enhanced error handling with specific validation messages and review option
-        keyboard = [[InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_lifestyle")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Specific error messages based on question type
-        if current_question_index == 0:
-            error_msg = "Por favor, introduce una edad válida (18-120 años)."
-        elif current_question_index == 1:
-            error_msg = "Por favor, introduce un porcentaje de grasa corporal válido (0-100%)."
-        elif current_question_index in [2, 3]:
-            error_msg = "Por favor, introduce un número del 1 al 5."
-        elif current_question_index == 4:
-            error_msg = "Por favor, introduce un número válido de veces por semana (0 o más)."
-        else:
-            error_msg = "Por favor, responde 'sí' o 'no'."
+        reply_markup = KB_LIFESTYLE_REVIEW
         
         # Enhanced progress display for errors
-        total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-        answered_questions = len(context.user_data.get("adam_answers", [])) + len(AMS_QUESTIONS) + current_question_index
-        overall_progress = (answered_questions / total_questions) * 100
-        progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
+        progress_text = PROGRESS_TEXTS["LIFESTYLE"][current_question_index]
         
-        progress_text = (
-            f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-            f"📋 **Sección:** Estilo de Vida - Pregunta {current_question_index + 1} de {len(LIFESTYLE_QUESTIONS)}\n\n"
-            f"{LIFESTYLE_QUESTIONS[current_question_index]}"
-        )
-        
-        await update.message.reply_text(error_msg)
-        await update.message.reply_text(text=progress_text, reply_markup=reply_markup)
+        await update.message.reply_text(text=f"{error_msg}\n\n{progress_text}", reply_markup=reply_markup)
         return STATE_LIFESTYLE
+    session.lifestyle_answers[question_key] = value
 
     # Avanza a la siguiente pregunta de estilo de vida.
     current_question_index += 1
-    context.user_data["lifestyle_question_index"] = current_question_index
+    session.lifestyle_question_index = current_question_index
 
     # Save progress after each answer
     if conversation_handler:
-        conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, context.user_data)
+        conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, session, fields=_LIFESTYLE_FIELDS)
 
     if current_question_index < len(LIFESTYLE_QUESTIONS):
         # Si quedan preguntas, hace la siguiente.
         # Enhanced progress display
-        total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-        answered_questions = len(context.user_data.get("adam_answers", [])) + len(AMS_QUESTIONS) + current_question_index
-        overall_progress = (answered_questions / total_questions) * 100
-        progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-        
-        progress_text = (
-            f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-            f"📋 **Sección:** Estilo de Vida - Pregunta {current_question_index + 1} de {len(LIFESTYLE_QUESTIONS)}\n\n"
-            f"{LIFESTYLE_QUESTIONS[current_question_index]}"
-        )
+        progress_text = PROGRESS_TEXTS["LIFESTYLE"][current_question_index]
         
         # Para la última pregunta, muestra botones Sí/No con opción de revisar.
         if current_question_index == 5:
-            keyboard = [
-                [InlineKeyboardButton("Sí", callback_data="ls_yes"), InlineKeyboardButton("No", callback_data="ls_no")],
-                [InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_lifestyle")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = KB_LIFESTYLE_FINAL
             await update.message.reply_text(text=progress_text, reply_markup=reply_markup)
         else:
-            keyboard = [[InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_lifestyle")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = KB_LIFESTYLE_REVIEW
             await update.message.reply_text(text=progress_text, reply_markup=reply_markup)
         return STATE_LIFESTYLE
     else:
@@ -603,16 +868,19 @@ async def lifestyle_button_handler(update: Update, context: ContextTypes.DEFAULT
     """Maneja la respuesta de Sí/No para la última pregunta de estilo de vida."""
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
+    session = _session(context)
     
-    current_question_index = context.user_data.get("lifestyle_question_index", 5)
+    current_question_index = session.lifestyle_question_index
     question_key = f"q{current_question_index}"
 
-    context.user_data["lifestyle_answers"][question_key] = query.data == 'ls_yes'
+    session.lifestyle_answers[question_key] = query.data == 'ls_yes'
     
     # Save final progress
     if conversation_handler:
-        conversation_handler.save_progress(user_id, ConversationState.RESULTS, context.user_data)
+        conversation_handler.save_progress(user_id, ConversationState.RESULTS, session, fields=("lifestyle_answers",))
+        # The completed questionnaire must not depend on the periodic flush
+        await conversation_handler.flush_progress()
     
     await query.edit_message_text("✅ Cuestionario completado al 100%. Calculando tus resultados...")
     return await send_final_results(update, context)
@@ -624,32 +892,24 @@ async def review_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id if update.effective_user else None
+    
+    route = REVIEW_ROUTES.get(query.data)
+    if route is None:
+        await query.edit_message_text("Opción de revisión no válida.")
+        return ConversationHandler.END
     
     try:
-        if query.data == "review_adam":
-            return await handle_adam_review(update, context)
-        elif query.data == "review_ams":
-            return await handle_ams_review(update, context)
-        elif query.data == "review_lifestyle":
-            return await handle_lifestyle_review(update, context)
-        else:
-            await query.edit_message_text("Opción de revisión no válida.")
-            return ConversationHandler.END
+        return await route(update, context)
             
     except Exception as e:
         if error_handler and logging_system:
-            error_context = ErrorContext(
-                user_id=user_id,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                function_name="review_handler"
-            )
+            error_context = _make_ctx(update, _uid(update), "review_handler")
             recovery_action, user_message = await error_handler.handle_error(e, error_context)
             
             if user_message:
                 await error_handler.safe_send_message(update, context, user_message)
         else:
-            logger.error(f"Error in review_handler: {e}")
+            logger.error("Error in review_handler: %s", e)
             await query.edit_message_text("Ha ocurrido un error durante la revisión.")
             
         return ConversationHandler.END
@@ -658,37 +918,31 @@ async def review_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def handle_adam_review(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Maneja la revisión de respuestas ADAM."""
     query = update.callback_query
-    adam_answers = context.user_data.get("adam_answers", [])
+    session = _session(context)
+    adam_mask = session.adam_mask
+    adam_count = session.adam_count
     
-    if not adam_answers:
+    if not adam_count:
         await query.edit_message_text("No hay respuestas ADAM para revisar.")
         return STATE_ADAM
     
     # Show summary of ADAM answers
-    review_text = "📝 **Revisión de respuestas ADAM:**\n\n"
-    for i, answer in enumerate(adam_answers):
-        response = "Sí" if answer else "No"
-        review_text += f"{i+1}. {ADAM_QUESTIONS[i][:50]}... → **{response}**\n"
-    
-    review_text += f"\n✅ Respuestas 'Sí': {sum(adam_answers)}/10"
-    review_text += "\n\n¿Qué te gustaría hacer?"
-    
-    keyboard = [
-        [InlineKeyboardButton("✅ Continuar", callback_data="continue_adam")],
-        [InlineKeyboardButton("🔄 Modificar última respuesta", callback_data="modify_adam_last")],
-        [InlineKeyboardButton("🔄 Reiniciar ADAM", callback_data="restart_adam")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    parts = ["📝 <b>Revisión de respuestas ADAM:</b>\n\n"]
+    for i, prefix in enumerate(_ADAM_REVIEW_PREFIXES[:adam_count]):
+        parts.append(f"{prefix}<b>{'Sí' if adam_mask >> i & 1 else 'No'}</b>\n")
+    parts.append(f"\n✅ Respuestas 'Sí': {adam_mask.bit_count()}/10\n\n¿Qué te gustaría hacer?")
+    review_text = "".join(parts)
     
-    await query.edit_message_text(text=review_text, reply_markup=reply_markup)
+    await query.edit_message_text(text=review_text, reply_markup=KB_REVIEW_ADAM)
     return STATE_ADAM
 
 
 async def handle_ams_review(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Maneja la revisión de respuestas AMS."""
     query = update.callback_query
-    ams_score = context.user_data.get("ams_score", 0)
-    ams_index = context.user_data.get("ams_question_index", 0)
+    session = _session(context)
+    ams_score = session.ams_score
+    ams_index = session.ams_question_index
     
     if ams_index == 0:
         await query.edit_message_text("No hay respuestas AMS para revisar.")
@@ -696,73 +950,69 @@ async def handle_ams_review(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Show AMS progress summary
     review_text = (
-        f"📝 **Revisión del progreso AMS:**\n\n"
+        f"📝 <b>Revisión del progreso AMS:</b>\n\n"
         f"Preguntas respondidas: {ams_index}/{len(AMS_QUESTIONS)}\n"
         f"Puntuación actual: {ams_score} puntos\n"
         f"Promedio por pregunta: {ams_score/ams_index:.1f}\n\n"
         f"¿Qué te gustaría hacer?"
     )
     
-    keyboard = [
-        [InlineKeyboardButton("✅ Continuar", callback_data="continue_ams")],
-        [InlineKeyboardButton("🔄 Modificar última respuesta", callback_data="modify_ams_last")],
-        [InlineKeyboardButton("🔄 Reiniciar AMS", callback_data="restart_ams")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(text=review_text, reply_markup=reply_markup)
+    await query.edit_message_text(text=review_text, reply_markup=KB_REVIEW_AMS)
     return STATE_AMS
 
 
 async def handle_lifestyle_review(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Maneja la revisión de respuestas de estilo de vida."""
     query = update.callback_query
-    lifestyle_answers = context.user_data.get("lifestyle_answers", {})
-    lifestyle_index = context.user_data.get("lifestyle_question_index", 0)
+    session = _session(context)
+    lifestyle_answers = session.lifestyle_answers
+    lifestyle_index = session.lifestyle_question_index
     
     if not lifestyle_answers:
         await query.edit_message_text("No hay respuestas de estilo de vida para revisar.")
         return STATE_LIFESTYLE
     
     # Show lifestyle answers summary
-    review_text = "📝 **Revisión de respuestas de Estilo de Vida:**\n\n"
-    
-    for i in range(lifestyle_index):
+    parts = ["📝 <b>Revisión de respuestas de Estilo de Vida:</b>\n\n"]
+    for i, fmt in enumerate(_LIFESTYLE_REVIEW_FMTS[:lifestyle_index]):
         question_key = f"q{i}"
         if question_key in lifestyle_answers:
             answer = lifestyle_answers[question_key]
-            if i == 0:  # Edad
-                review_text += f"Edad: {answer} años\n"
-            elif i == 1:  # Grasa corporal
-                review_text += f"Grasa corporal: {answer}%\n"
-            elif i == 2:  # Sueño
-                review_text += f"Calidad del sueño: {answer}/5\n"
-            elif i == 3:  # Estrés
-                review_text += f"Nivel de estrés: {answer}/5\n"
-            elif i == 4:  # Ejercicio
-                review_text += f"Ejercicio por semana: {answer} veces\n"
-            elif i == 5:  # Alcohol/Tabaco
-                response = "Sí" if answer else "No"
-                review_text += f"Alcohol/Tabaco regular: {response}\n"
-    
-    review_text += "\n¿Qué te gustaría hacer?"
-    
-    keyboard = [
-        [InlineKeyboardButton("✅ Continuar", callback_data="continue_lifestyle")],
-        [InlineKeyboardButton("🔄 Modificar última respuesta", callback_data="modify_lifestyle_last")],
-        [InlineKeyboardButton("🔄 Reiniciar Estilo de Vida", callback_data="restart_lifestyle")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+            parts.append(fmt.format(answer) if fmt else f"Alcohol/Tabaco regular: {'Sí' if answer else 'No'}\n")
+    parts.append("\n¿Qué te gustaría hacer?")
+    review_text = "".join(parts)
     
-    await query.edit_message_text(text=review_text, reply_markup=reply_markup)
+    await query.edit_message_text(text=review_text, reply_markup=KB_REVIEW_LIFESTYLE)
     return STATE_LIFESTYLE
 
 
+# Vista de revisión por callback_data
+REVIEW_ROUTES = {
+    "review_adam": handle_adam_review,
+    "review_ams": handle_ams_review,
+    "review_lifestyle": handle_lifestyle_review,
+}
+
+
+# Fecha de finalización con resolución de minuto: (minuto epoch, texto)
+_minute_cache = (-1, "")
+
+
+def _now_minute_str() -> str:
+    """Devuelve la fecha actual "%Y-%m-%d %H:%M", formateándola solo al cambiar de minuto."""
+    global _minute_cache
+    minute = int(time.time()) // 60
+    if minute != _minute_cache[0]:
+        _minute_cache = (minute, datetime.fromtimestamp(minute * 60).strftime("%Y-%m-%d %H:%M"))
+    return _minute_cache[1]
+
+
 async def send_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Calcula todos los resultados y envía el mensaje final al usuario.
     """
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
+    session = _session(context)
     
     try:
         # Log completion
@@ -770,19 +1020,19 @@ async def send_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
             logging_system.log_user_action(user_id, "questionnaire_completed")
         
         # --- 1. Cálculo del resultado ADAM ---
-        adam_answers = context.user_data["adam_answers"]
+        adam_mask = session.adam_mask
         # Regla: "sí" en la pregunta 1, 7, o en 3 preguntas cualesquiera.
-        is_q1_yes = adam_answers[0]
-        is_q7_yes = adam_answers[6]
-        total_yes = sum(1 for answer in adam_answers if answer)
+        total_yes = adam_mask.bit_count()
+        # Bits 0 y 6 = preguntas 1 y 7
+        adam_positive = bool(adam_mask & 0b1000001) or total_yes >= 3
         
-        if is_q1_yes or is_q7_yes or total_yes >= 3:
+        if adam_positive:
             adam_result = "🔴 Posible déficit."
         else:
             adam_result = "🟢 No se detecta un posible déficit."
 
         # --- 2. Cálculo del resultado AMS ---
-        ams_score = context.user_data["ams_score"]
+        ams_score = session.ams_score
         if ams_score <= 26:
             ams_interpretation = "No significativo"
         elif 27 <= ams_score <= 36:
@@ -794,18 +1044,11 @@ async def send_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
         ams_result = f"{ams_score} puntos → {ams_interpretation}."
 
         # --- 3. Análisis de factores de estilo de vida ---
-        lifestyle_answers = context.user_data["lifestyle_answers"]
-        lifestyle_factors = []
-        if lifestyle_answers.get("q2", 15) > 20:
-            lifestyle_factors.append("Grasa corporal elevada")
-        if lifestyle_answers.get("q3", 3) <= 2:
-            lifestyle_factors.append("Mala calidad del sueño")
-        if lifestyle_answers.get("q4", 3) >= 4:
-            lifestyle_factors.append("Alto nivel de estrés")
-        if lifestyle_answers.get("q5", 2) < 2:
-            lifestyle_factors.append("Poco ejercicio de fuerza")
-        if lifestyle_answers.get("q6", False):
-            lifestyle_factors.append("Consumo regular de alcohol/tabaco")
+        lifestyle_answers = session.lifestyle_answers
+        lifestyle_factors = [
+            label for key, default, op, threshold, label in _LIFESTYLE_RULES
+            if op(lifestyle_answers.get(key, default), threshold)
+        ]
 
         if lifestyle_factors:
             lifestyle_summary = "Factores a mejorar: " + ", ".join(lifestyle_factors) + "."
@@ -813,43 +1056,9 @@ async def send_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
             lifestyle_summary = "Tus hábitos de estilo de vida parecen adecuados."
 
         # --- 4. Construcción del mensaje final ---
-        final_message = (
-            "🧬 **BOT DE TESTOSTERONA** 🧬\n"
-            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-            "📝 **RESULTADOS DE TU EVALUACIÓN**\n"
-            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-            f"✅ **Resultado ADAM:** {adam_result}\n"
-            f"📊 **Escala AMS:** {ams_result}\n"
-            f"🏃‍♂️ **Estilo de Vida:** {lifestyle_summary}\n\n"
-            "👉 **Recomendación:**\n"
-            "Recuerda que esto es solo una estimación. Si tus resultados indican un posible déficit o síntomas moderados/severos, considera consultar a un médico especialista (urólogo o endocrinólogo) para un diagnóstico preciso a través de un análisis de sangre.\n\n"
-            "Para volver a empezar, escribe /start."
-        )
-        
-        # Enhanced result sharing options (Requirement 6.4)
-        keyboard = [
-            [InlineKeyboardButton("💾 Guardar resultados", callback_data="save_results")],
-            [InlineKeyboardButton("📤 Compartir resultados", callback_data="share_results")],
-            [InlineKeyboardButton("📊 Ver detalles", callback_data="detailed_results")],
-            [InlineKeyboardButton("🔄 Nuevo cuestionario", callback_data="new_questionnaire")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Send message with retry mechanism and result options
-        if error_handler:
-            # Use retry decorator for network operations
-            @error_handler.with_retry(max_retries=3)
-            async def send_results_with_retry():
-                chat_id = update.effective_chat.id
-                await context.bot.send_message(chat_id=chat_id, text=final_message, reply_markup=reply_markup)
-            
-            await send_results_with_retry()
-        else:
-            chat_id = update.effective_chat.id
-            await context.bot.send_message(chat_id=chat_id, text=final_message, reply_markup=reply_markup)
-        
         # Store results temporarily for saving/sharing
-        context.user_data["final_results"] = {
+        context.user_data.pop("_rendered_results", None)
+        results = context.user_data["final_results"] = {
             "adam_result": adam_result,
             "ams_result": ams_result,
             "lifestyle_summary": lifestyle_summary,
@@ -857,13 +1066,21 @@ async def send_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "ams_score": ams_score,
             "ams_interpretation": ams_interpretation,
             "lifestyle_factors": lifestyle_factors,
-            "completion_date": datetime.now().strftime("%Y-%m-%d %H:%M")
+            "lifestyle_factors_count": len(lifestyle_factors),
+            "completion_date": _now_minute_str()
         }
+        final_message = _FINAL_TMPL.format_map(results)
+        
+        # Enhanced result sharing options (Requirement 6.4)
+        reply_markup = KB_RESULTS
+        
+        # Send message with retry mechanism and result options
+        await _send_results(context.bot, update.effective_chat.id, final_message, reply_markup)
         
         # Log results for analytics (anonymized)
         if logging_system:
             results_data = {
-                "adam_positive": is_q1_yes or is_q7_yes or total_yes >= 3,
+                "adam_positive": adam_positive,
                 "adam_yes_count": total_yes,
                 "ams_score": ams_score,
                 "ams_interpretation": ams_interpretation,
@@ -876,30 +1093,117 @@ async def send_final_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
             
     except Exception as e:
         if error_handler and logging_system:
-            error_context = ErrorContext(
-                user_id=user_id,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                function_name="send_final_results"
-            )
+            error_context = _make_ctx(update, user_id, "send_final_results")
             recovery_action, user_message = await error_handler.handle_error(e, error_context)
             
             if user_message:
                 await error_handler.safe_send_message(update, context, user_message)
         else:
-            logger.error(f"Error in send_final_results: {e}")
+            logger.error("Error in send_final_results: %s", e)
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text="Ha ocurrido un error al generar los resultados. Por favor, intenta de nuevo con /start."
             )
 
 
+def _render_detailed_results(results: dict) -> str:
+    """Construye el análisis detallado a partir de final_results."""
+    # Show detailed breakdown with enhanced information
+    lifestyle_factors = results['lifestyle_factors']
+    if lifestyle_factors:
+        lifestyle_factors_text = "\n".join(f"• {i}. {factor}" for i, factor in enumerate(lifestyle_factors, 1))
+    else:
+        lifestyle_factors_text = _NO_LIFESTYLE_FACTORS_TEXT
+    return _DETAILED_TMPL.format_map({**results, "lifestyle_factors_text": lifestyle_factors_text})
+
+
+def _rendered_results_text(context: ContextTypes.DEFAULT_TYPE, key: str, results: dict, render) -> str:
+    """
+    Devuelve la vista de resultados `key`, renderizándola solo la primera vez.
+    
+    Las vistas se guardan en user_data["_rendered_results"], que se descarta
+    al calcular nuevos resultados o empezar otro cuestionario.
+    """
+    rendered = context.user_data.setdefault("_rendered_results", {})
+    text = rendered.get(key)
+    if text is None:
+        text = rendered[key] = render(results)
+    return text
+
+
+async def _send_results_view(update: Update, context: ContextTypes.DEFAULT_TYPE, results: dict,
+                             user_id: Optional[int], view: str, render, action: str) -> int:
+    """
+    Muestra una vista de resultados con el teclado de resultados y registra la acción.
+    
+    Args:
+        view: Clave de la vista en la caché de _rendered_results_text
+        render: Función que construye el texto a partir de final_results
+        action: Acción registrada en log_user_action
+    """
+    text = _rendered_results_text(context, view, results, render)
+    await _edit_query_message(update.callback_query, text, KB_RESULTS)
+    
+    if logging_system:
+        logging_system.log_user_action(user_id, action)
+    return STATE_RESULTS
+
+
+async def _results_save(update: Update, context: ContextTypes.DEFAULT_TYPE, results: dict, user_id: Optional[int]) -> int:
+    """Muestra el resumen de resultados listo para guardar."""
+    return await _send_results_view(update, context, results, user_id, "saved", _SAVED_TMPL.format_map, "results_saved")
+
+
+async def _results_share(update: Update, context: ContextTypes.DEFAULT_TYPE, results: dict, user_id: Optional[int]) -> int:
+    """Muestra un resumen anónimo de los resultados para compartir."""
+    return await _send_results_view(update, context, results, user_id, "share", _SHARE_TMPL.format_map, "results_shared")
+
+
+async def _results_detailed(update: Update, context: ContextTypes.DEFAULT_TYPE, results: dict, user_id: Optional[int]) -> int:
+    """Muestra el análisis detallado de los resultados."""
+    return await _send_results_view(update, context, results, user_id, "detailed", _render_detailed_results, "detailed_results_viewed")
+
+
+async def _results_new_questionnaire(update: Update, context: ContextTypes.DEFAULT_TYPE, results: dict, user_id: Optional[int]) -> int:
+    """Borra los datos del usuario y ofrece empezar un cuestionario nuevo."""
+    query = update.callback_query
+    # Clear all data and start fresh
+    if conversation_handler:
+        conversation_handler.clear_user_data(user_id)
+    context.user_data.clear()
+    
+    # Log new questionnaire action
+    if logging_system:
+        logging_system.log_user_action(user_id, "new_questionnaire_started")
+    
+    # Show welcome message and start new questionnaire
+    message = (
+        "🔄 <b>Nuevo Cuestionario de Testosterona</b>\n\n"
+        "Te haré una serie de preguntas basadas en cuestionarios médicos (ADAM + AMS) y sobre tu estilo de vida para darte una estimación de tu nivel de testosterona.\n\n"
+        "⚠️ <b>Importante:</b> Esto NO reemplaza un análisis de sangre ni una consulta médica. Es solo una herramienta orientativa.\n\n"
+        "¿Quieres comenzar un nuevo cuestionario?"
+    )
+    
+    await query.edit_message_text(message, reply_markup=KB_START)
+    return STATE_START
+
+
+# Acción de resultados por callback_data; cada una devuelve el siguiente estado
+RESULTS_ROUTES = {
+    "save_results": _results_save,
+    "share_results": _results_share,
+    "detailed_results": _results_detailed,
+    "new_questionnaire": _results_new_questionnaire,
+}
+
+
 async def results_action_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Maneja las acciones de guardar, compartir y ver detalles de los resultados.
     """
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
     
     try:
         results = context.user_data.get("final_results")
@@ -907,397 +1211,233 @@ async def results_action_handler(update: Update, context: ContextTypes.DEFAULT_T
             await query.edit_message_text("Los resultados ya no están disponibles. Usa /start para realizar un nuevo cuestionario.")
             return ConversationHandler.END
         
-        if query.data == "save_results":
-            # Generate a formatted results summary for saving
-            saved_results = (
-                f"🧪 **Resultados del Cuestionario de Testosterona**\n"
-                f"📅 Fecha: {results['completion_date']}\n\n"
-                f"**ADAM:** {results['adam_result']}\n"
-                f"**AMS:** {results['ams_result']}\n"
-                f"**Estilo de Vida:** {results['lifestyle_summary']}\n\n"
-                f"**Detalles:**\n"
-                f"• Respuestas ADAM 'Sí': {results['adam_yes_count']}/10\n"
-                f"• Puntuación AMS: {results['ams_score']} ({results['ams_interpretation']})\n"
-                f"• Factores de riesgo identificados: {len(results['lifestyle_factors'])}\n\n"
-                f"⚠️ Estos resultados son solo orientativos. Consulta a un médico para un diagnóstico preciso."
-            )
-            
-            # Create enhanced keyboard with all options
-            keyboard = [
-                [InlineKeyboardButton("💾 Guardar resultados", callback_data="save_results")],
-                [InlineKeyboardButton("📤 Compartir resultados", callback_data="share_results")],
-                [InlineKeyboardButton("📊 Ver detalles", callback_data="detailed_results")],
-                [InlineKeyboardButton("🔄 Nuevo cuestionario", callback_data="new_questionnaire")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                f"💾 **Resultados guardados:**\n\n{saved_results}\n\n"
-                f"Puedes copiar este texto para guardarlo en tus notas personales.",
-                reply_markup=reply_markup
-            )
-            
-            # Log save action
-            if logging_system:
-                logging_system.log_user_action(user_id, "results_saved")
-                
-        elif query.data == "share_results":
-            # Generate a shareable summary (without personal details)
-            share_text = (
-                f"🧪 **Resumen de Evaluación de Testosterona**\n\n"
-                f"**ADAM:** {results['adam_result']}\n"
-                f"**AMS:** {results['ams_interpretation']} ({results['ams_score']} puntos)\n"
-                f"**Factores de estilo de vida:** {len(results['lifestyle_factors'])} identificados\n\n"
-                f"⚠️ Resultados orientativos. Consulta médica recomendada.\n\n"
-                f"🤖 Evaluación realizada con el Bot de Testosterona"
-            )
-            
-            # Create enhanced keyboard with all options
-            keyboard = [
-                [InlineKeyboardButton("💾 Guardar resultados", callback_data="save_results")],
-                [InlineKeyboardButton("📤 Compartir resultados", callback_data="share_results")],
-                [InlineKeyboardButton("📊 Ver detalles", callback_data="detailed_results")],
-                [InlineKeyboardButton("🔄 Nuevo cuestionario", callback_data="new_questionnaire")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                f"📤 **Texto para compartir:**\n\n{share_text}\n\n"
-                f"Puedes copiar este texto para compartir tus resultados de forma anónima.",
-                reply_markup=reply_markup
-            )
-            
-            # Log share action
-            if logging_system:
-                logging_system.log_user_action(user_id, "results_shared")
-                
-        elif query.data == "detailed_results":
-            # Show detailed breakdown with enhanced information
-            detailed_text = (
-                f"📊 **Análisis Detallado Completo**\n\n"
-                f"**📋 Cuestionario ADAM (Androgen Deficiency in Aging Males):**\n"
-                f"• Respuestas 'Sí': {results['adam_yes_count']}/10\n"
-                f"• Resultado: {results['adam_result']}\n"
-                f"• Criterio: Posible déficit si pregunta 1 o 7 es 'Sí', o 3+ respuestas 'Sí'\n\n"
-                f"**📈 Escala AMS (Aging Male's Symptoms):**\n"
-                f"• Puntuación total: {results['ams_score']}/85 puntos\n"
-                f"• Interpretación: {results['ams_interpretation']}\n"
-                f"• Rangos de interpretación:\n"
-                f"  - ≤26: No significativo\n"
-                f"  - 27-36: Leve\n"
-                f"  - 37-49: Moderado\n"
-                f"  - ≥50: Severo\n\n"
-                f"**🏃‍♂️ Factores de Estilo de Vida Analizados:**\n"
-            )
-            
-            if results['lifestyle_factors']:
-                for i, factor in enumerate(results['lifestyle_factors'], 1):
-                    detailed_text += f"• {i}. {factor}\n"
-            else:
-                detailed_text += "• ✅ No se identificaron factores de riesgo significativos\n"
-            
-            # Add more detailed recommendations
-            detailed_text += (
-                f"\n**💡 Recomendaciones Específicas:**\n"
-                f"• 🏥 Consulta médica si hay síntomas moderados/severos\n"
-                f"• 🧪 Análisis de sangre (testosterona total y libre)\n"
-                f"• 💪 Ejercicio de fuerza regular (3-4 veces/semana)\n"
-                f"• 😴 Mejorar calidad del sueño (7-9 horas)\n"
-                f"• 🍎 Alimentación equilibrada y reducción de estrés\n"
-                f"• 🚫 Evitar alcohol y tabaco en exceso\n\n"
-                f"**⚠️ Importante:** Estos resultados son orientativos. Solo un análisis de sangre y consulta médica pueden confirmar un diagnóstico real."
-            )
-            
-            # Create enhanced keyboard with all options
-            keyboard = [
-                [InlineKeyboardButton("💾 Guardar resultados", callback_data="save_results")],
-                [InlineKeyboardButton("📤 Compartir resultados", callback_data="share_results")],
-                [InlineKeyboardButton("📊 Ver detalles", callback_data="detailed_results")],
-                [InlineKeyboardButton("🔄 Nuevo cuestionario", callback_data="new_questionnaire")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(detailed_text, reply_markup=reply_markup)
-            
-            # Log detailed view action
-            if logging_system:
-                logging_system.log_user_action(user_id, "detailed_results_viewed")
-        
-        elif query.data == "new_questionnaire":
-            # Clear all data and start fresh
-            if conversation_handler:
-                conversation_handler.clear_user_data(user_id)
-            context.user_data.clear()
-            
-            # Log new questionnaire action
-            if logging_system:
-                logging_system.log_user_action(user_id, "new_questionnaire_started")
-            
-            # Show welcome message and start new questionnaire
-            keyboard = [
-                [InlineKeyboardButton("✅ Sí, comenzar", callback_data="start_yes"),
-                 InlineKeyboardButton("❌ No, ahora no", callback_data="start_no")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            message = (
-                "🔄 **Nuevo Cuestionario de Testosterona**\n\n"
-                "Te haré una serie de preguntas basadas en cuestionarios médicos (ADAM + AMS) y sobre tu estilo de vida para darte una estimación de tu nivel de testosterona.\n\n"
-                "⚠️ **Importante:** Esto NO reemplaza un análisis de sangre ni una consulta médica. Es solo una herramienta orientativa.\n\n"
-                "¿Quieres comenzar un nuevo cuestionario?"
-            )
-            
-            await query.edit_message_text(message, reply_markup=reply_markup)
-            return STATE_START
-        
-        # Don't clear data after other actions - keep results available
-        return STATE_RESULTS
+        route = RESULTS_ROUTES.get(query.data)
+        if route is None:
+            return STATE_RESULTS
+        return await route(update, context, results, user_id)
         
     except Exception as e:
         if error_handler and logging_system:
-            error_context = ErrorContext(
-                user_id=user_id,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                function_name="results_action_handler"
-            )
+            error_context = _make_ctx(update, user_id, "results_action_handler")
             recovery_action, user_message = await error_handler.handle_error(e, error_context)
             
             if user_message:
                 await error_handler.safe_send_message(update, context, user_message)
         else:
-            logger.error(f"Error in results_action_handler: {e}")
+            logger.error("Error in results_action_handler: %s", e)
             await query.edit_message_text("Ha ocurrido un error. Los resultados se han perdido.")
             
         return ConversationHandler.END
 
 
+async def _continue_adam(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Continúa el cuestionario ADAM desde la posición actual."""
+    await update.callback_query.edit_message_text("Continuando con el cuestionario...")
+    current_index = session.adam_count
+    if current_index < len(ADAM_QUESTIONS):
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=PROGRESS_TEXTS["ADAM"][current_index],
+            reply_markup=KB_ADAM
+        )
+        return STATE_ADAM
+    return None
+
+
+async def _continue_ams(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Continúa la escala AMS desde la posición actual."""
+    await update.callback_query.edit_message_text("Continuando con el cuestionario...")
+    current_index = session.ams_question_index
+    if current_index < len(AMS_QUESTIONS):
+        progress_text = (
+            f"{PROGRESS_HEADERS['AMS'][current_index]}"
+            f"💯 <b>Puntuación actual:</b> {session.ams_score} puntos\n\n"
+            f"{AMS_QUESTIONS[current_index]}"
+        )
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=progress_text,
+            reply_markup=KB_AMS_REVIEW
+        )
+        return STATE_AMS
+    return None
+
+
+async def _continue_lifestyle(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Continúa las preguntas de estilo de vida desde la posición actual."""
+    await update.callback_query.edit_message_text("Continuando con el cuestionario...")
+    current_index = session.lifestyle_question_index
+    if current_index < len(LIFESTYLE_QUESTIONS):
+        # La última pregunta se responde con botones
+        reply_markup = KB_LIFESTYLE_FINAL if current_index == 5 else KB_LIFESTYLE_REVIEW
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=PROGRESS_TEXTS["LIFESTYLE"][current_index],
+            reply_markup=reply_markup
+        )
+        return STATE_LIFESTYLE
+    return None
+
+
+async def _modify_adam_last(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Elimina la última respuesta ADAM y vuelve a preguntarla."""
+    adam_count = session.adam_count
+    if not adam_count:
+        return None
+    # Remove last answer
+    adam_count -= 1
+    session.adam_mask &= ~(1 << adam_count)
+    session.adam_count = adam_count
+    
+    if conversation_handler:
+        conversation_handler.save_progress(user_id, ConversationState.ADAM, session, fields=_ADAM_FIELDS)
+    
+    await update.callback_query.edit_message_text(
+        f"🔄 Modificando respuesta anterior.\n\n{ADAM_QUESTIONS[adam_count]}",
+        reply_markup=KB_ADAM
+    )
+    return STATE_ADAM
+
+
+async def _modify_ams_last(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Descuenta la última respuesta AMS y vuelve a preguntarla."""
+    ams_index = session.ams_question_index
+    if ams_index <= 0:
+        return None
+    current_index = ams_index - 1
+    ams_scores = session.ams_scores
+    if len(ams_scores) == ams_index:
+        # With the per-answer history the previous score can be undone right away
+        session.ams_score -= ams_scores.pop()
+        text = (
+            f"🔄 Modificando respuesta anterior.\n\n"
+            f"{PROGRESS_HEADERS['AMS'][current_index]}"
+            f"💯 <b>Puntuación actual:</b> {session.ams_score} puntos\n\n"
+            f"{AMS_QUESTIONS[current_index]}"
+        )
+    else:
+        # Progress saved before the history existed: the previous score is unknown
+        text = (
+            f"🔄 Para modificar tu respuesta anterior, por favor responde nuevamente a:\n\n"
+            f"{AMS_QUESTIONS[current_index]}\n\n"
+            f"Tu respuesta anterior será reemplazada."
+        )
+    session.ams_question_index = current_index
+    
+    if conversation_handler:
+        conversation_handler.save_progress(user_id, ConversationState.AMS, session, fields=_AMS_FIELDS)
+    
+    await update.callback_query.edit_message_text(text, reply_markup=KB_AMS_REVIEW)
+    return STATE_AMS
+
+
+async def _modify_lifestyle_last(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Elimina la última respuesta de estilo de vida y vuelve a preguntarla."""
+    lifestyle_index = session.lifestyle_question_index
+    if lifestyle_index <= 0:
+        return None
+    current_index = lifestyle_index - 1
+    session.lifestyle_answers.pop(f"q{current_index}", None)
+    session.lifestyle_question_index = current_index
+    
+    if conversation_handler:
+        conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, session, fields=_LIFESTYLE_FIELDS)
+    
+    await update.callback_query.edit_message_text(
+        f"🔄 Modificando respuesta anterior.\n\n{LIFESTYLE_QUESTIONS[current_index]}"
+    )
+    return STATE_LIFESTYLE
+
+
+async def _restart_adam(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Reinicia el cuestionario ADAM."""
+    session.adam_mask = 0
+    session.adam_count = 0
+    if conversation_handler:
+        conversation_handler.save_progress(user_id, ConversationState.ADAM, session, fields=_ADAM_FIELDS)
+    
+    await update.callback_query.edit_message_text(
+        f"🔄 Reiniciando cuestionario ADAM.\n\n{ADAM_QUESTIONS[0]}",
+        reply_markup=KB_ADAM_ANSWER
+    )
+    return STATE_ADAM
+
+
+async def _restart_ams(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Reinicia la escala AMS."""
+    session.ams_score = 0
+    session.ams_question_index = 0
+    session.ams_scores = []
+    if conversation_handler:
+        conversation_handler.save_progress(user_id, ConversationState.AMS, session, fields=_AMS_FIELDS)
+    
+    await update.callback_query.edit_message_text(
+        f"🔄 Reiniciando cuestionario AMS.\n\n{AMS_QUESTIONS[0]}"
+    )
+    return STATE_AMS
+
+
+async def _restart_lifestyle(update: Update, context: ContextTypes.DEFAULT_TYPE, session: SessionState, user_id: Optional[int]) -> Optional[int]:
+    """Reinicia las preguntas de estilo de vida."""
+    session.lifestyle_answers = {}
+    session.lifestyle_question_index = 0
+    if conversation_handler:
+        conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, session, fields=_LIFESTYLE_FIELDS)
+    
+    await update.callback_query.edit_message_text(
+        f"🔄 Reiniciando preguntas de estilo de vida.\n\n{LIFESTYLE_QUESTIONS[0]}"
+    )
+    return STATE_LIFESTYLE
+
+
+# Acción de modificación por callback_data; None termina la conversación
+MODIFICATION_ROUTES = {
+    "continue_adam": _continue_adam,
+    "modify_adam_last": _modify_adam_last,
+    "restart_adam": _restart_adam,
+    "continue_ams": _continue_ams,
+    "modify_ams_last": _modify_ams_last,
+    "restart_ams": _restart_ams,
+    "continue_lifestyle": _continue_lifestyle,
+    "modify_lifestyle_last": _modify_lifestyle_last,
+    "restart_lifestyle": _restart_lifestyle,
+}
+
+
+def _route_pattern(routes: dict, section: Optional[str] = None) -> re.Pattern:
+    """
+    Regex de CallbackQueryHandler que acepta exactamente las claves de `routes`.
+    
+    Con `section` solo se incluyen las claves de esa sección (p. ej. "ams"),
+    de modo que cada estado registra únicamente sus propias acciones.
+    """
+    keys = [key for key in routes if section is None or key.split("_")[1] == section]
+    return re.compile("^(?:" + "|".join(map(re.escape, keys)) + ")$")
+
+
 async def modification_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Maneja las modificaciones y continuaciones desde las revisiones.
     """
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
+    session = _session(context)
     
     try:
-        if query.data.startswith("continue_"):
-            # Continue from current position
-            section = query.data.split("_")[1]
-            await query.edit_message_text("Continuando con el cuestionario...")
-            
-            if section == "adam":
-                current_index = len(context.user_data.get("adam_answers", []))
-                if current_index < len(ADAM_QUESTIONS):
-                    keyboard = [
-                        [InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")],
-                        [InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_adam")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-                    overall_progress = (current_index / total_questions) * 100
-                    progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-                    
-                    progress_text = (
-                        f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-                        f"📋 **Sección:** ADAM - Pregunta {current_index + 1} de {len(ADAM_QUESTIONS)}\n\n"
-                        f"{ADAM_QUESTIONS[current_index]}"
-                    )
-                    
-                    await context.bot.send_message(
-                        chat_id=update.effective_chat.id,
-                        text=progress_text,
-                        reply_markup=reply_markup
-                    )
-                    return STATE_ADAM
-                    
-            elif section == "ams":
-                current_index = context.user_data.get("ams_question_index", 0)
-                if current_index < len(AMS_QUESTIONS):
-                    total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-                    answered_questions = len(context.user_data.get("adam_answers", [])) + current_index
-                    overall_progress = (answered_questions / total_questions) * 100
-                    progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-                    
-                    keyboard = [[InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_ams")]]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    progress_text = (
-                        f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-                        f"📋 **Sección:** AMS - Pregunta {current_index + 1} de {len(AMS_QUESTIONS)}\n"
-                        f"💯 **Puntuación actual:** {context.user_data.get('ams_score', 0)} puntos\n\n"
-                        f"{AMS_QUESTIONS[current_index]}"
-                    )
-                    
-                    await context.bot.send_message(
-                        chat_id=update.effective_chat.id,
-                        text=progress_text,
-                        reply_markup=reply_markup
-                    )
-                    return STATE_AMS
-                    
-            elif section == "lifestyle":
-                current_index = context.user_data.get("lifestyle_question_index", 0)
-                if current_index < len(LIFESTYLE_QUESTIONS):
-                    total_questions = len(ADAM_QUESTIONS) + len(AMS_QUESTIONS) + len(LIFESTYLE_QUESTIONS)
-                    answered_questions = len(context.user_data.get("adam_answers", [])) + len(AMS_QUESTIONS) + current_index
-                    overall_progress = (answered_questions / total_questions) * 100
-                    progress_bar = "█" * int(overall_progress / 10) + "░" * (10 - int(overall_progress / 10))
-                    
-                    progress_text = (
-                        f"📊 **Progreso General:** {int(overall_progress)}% [{progress_bar}]\n"
-                        f"📋 **Sección:** Estilo de Vida - Pregunta {current_index + 1} de {len(LIFESTYLE_QUESTIONS)}\n\n"
-                        f"{LIFESTYLE_QUESTIONS[current_index]}"
-                    )
-                    
-                    if current_index == 5:  # Last question with buttons
-                        keyboard = [
-                            [InlineKeyboardButton("Sí", callback_data="ls_yes"), InlineKeyboardButton("No", callback_data="ls_no")],
-                            [InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_lifestyle")]
-                        ]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=progress_text,
-                            reply_markup=reply_markup
-                        )
-                    else:
-                        keyboard = [[InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_lifestyle")]]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=progress_text,
-                            reply_markup=reply_markup
-                        )
-                    return STATE_LIFESTYLE
-                    
-        elif query.data.startswith("modify_") and query.data.endswith("_last"):
-            # Modify last answer
-            section = query.data.split("_")[1]
-            
-            if section == "adam":
-                adam_answers = context.user_data.get("adam_answers", [])
-                if adam_answers:
-                    # Remove last answer
-                    adam_answers.pop()
-                    context.user_data["adam_answers"] = adam_answers
-                    
-                    # Save progress
-                    if conversation_handler:
-                        conversation_handler.save_progress(user_id, ConversationState.ADAM, context.user_data)
-                    
-                    # Re-ask the question
-                    current_index = len(adam_answers)
-                    keyboard = [
-                        [InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")],
-                        [InlineKeyboardButton("📝 Revisar respuesta anterior", callback_data="review_adam")]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    await query.edit_message_text(
-                        f"🔄 Modificando respuesta anterior.\n\n{ADAM_QUESTIONS[current_index]}",
-                        reply_markup=reply_markup
-                    )
-                    return STATE_ADAM
-                    
-            elif section == "ams":
-                ams_index = context.user_data.get("ams_question_index", 0)
-                if ams_index > 0:
-                    # We need to ask user what their previous answer was to subtract it
-                    await query.edit_message_text(
-                        f"🔄 Para modificar tu respuesta anterior, por favor responde nuevamente a:\n\n"
-                        f"{AMS_QUESTIONS[ams_index - 1]}\n\n"
-                        f"Tu respuesta anterior será reemplazada."
-                    )
-                    
-                    # Adjust index and score
-                    context.user_data["ams_question_index"] = ams_index - 1
-                    # Note: We can't easily subtract the previous score without knowing it
-                    # So we'll let the user re-answer and handle it in the handler
-                    
-                    if conversation_handler:
-                        conversation_handler.save_progress(user_id, ConversationState.AMS, context.user_data)
-                    
-                    return STATE_AMS
-                    
-            elif section == "lifestyle":
-                lifestyle_index = context.user_data.get("lifestyle_question_index", 0)
-                if lifestyle_index > 0:
-                    # Remove last answer
-                    question_key = f"q{lifestyle_index - 1}"
-                    lifestyle_answers = context.user_data.get("lifestyle_answers", {})
-                    if question_key in lifestyle_answers:
-                        del lifestyle_answers[question_key]
-                    
-                    context.user_data["lifestyle_question_index"] = lifestyle_index - 1
-                    
-                    if conversation_handler:
-                        conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, context.user_data)
-                    
-                    # Re-ask the question
-                    current_index = lifestyle_index - 1
-                    await query.edit_message_text(
-                        f"🔄 Modificando respuesta anterior.\n\n{LIFESTYLE_QUESTIONS[current_index]}"
-                    )
-                    return STATE_LIFESTYLE
-                    
-        elif query.data.startswith("restart_"):
-            # Restart entire section
-            section = query.data.split("_")[1]
-            
-            if section == "adam":
-                context.user_data["adam_answers"] = []
-                if conversation_handler:
-                    conversation_handler.save_progress(user_id, ConversationState.ADAM, context.user_data)
-                
-                keyboard = [
-                    [InlineKeyboardButton("Sí", callback_data="adam_yes"), InlineKeyboardButton("No", callback_data="adam_no")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"🔄 Reiniciando cuestionario ADAM.\n\n{ADAM_QUESTIONS[0]}",
-                    reply_markup=reply_markup
-                )
-                return STATE_ADAM
-                
-            elif section == "ams":
-                context.user_data["ams_score"] = 0
-                context.user_data["ams_question_index"] = 0
-                if conversation_handler:
-                    conversation_handler.save_progress(user_id, ConversationState.AMS, context.user_data)
-                
-                await query.edit_message_text(
-                    f"🔄 Reiniciando cuestionario AMS.\n\n{AMS_QUESTIONS[0]}"
-                )
-                return STATE_AMS
-                
-            elif section == "lifestyle":
-                context.user_data["lifestyle_answers"] = {}
-                context.user_data["lifestyle_question_index"] = 0
-                if conversation_handler:
-                    conversation_handler.save_progress(user_id, ConversationState.LIFESTYLE, context.user_data)
-                
-                await query.edit_message_text(
-                    f"🔄 Reiniciando preguntas de estilo de vida.\n\n{LIFESTYLE_QUESTIONS[0]}"
-                )
-                return STATE_LIFESTYLE
-        
-        return ConversationHandler.END
+        route = MODIFICATION_ROUTES.get(query.data)
+        next_state = await route(update, context, session, user_id) if route else None
+        return ConversationHandler.END if next_state is None else next_state
         
     except Exception as e:
         if error_handler and logging_system:
-            error_context = ErrorContext(
-                user_id=user_id,
-                chat_id=update.effective_chat.id if update.effective_chat else None,
-                function_name="modification_handler"
-            )
+            error_context = _make_ctx(update, user_id, "modification_handler")
             recovery_action, user_message = await error_handler.handle_error(e, error_context)
             
             if user_message:
                 await error_handler.safe_send_message(update, context, user_message)
         else:
-            logger.error(f"Error in modification_handler: {e}")
+            logger.error("Error in modification_handler: %s", e)
             await query.edit_message_text("Ha ocurrido un error durante la modificación.")
             
         return ConversationHandler.END
@@ -1307,7 +1447,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
     Cancela la conversación en cualquier momento con /cancel.
     """
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
     
     # Clear persistent data
     if conversation_handler:
@@ -1322,7 +1462,7 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """
     Muestra el progreso actual del usuario con /status.
     """
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
     
     if not conversation_handler:
         await update.message.reply_text("Sistema de progreso no disponible.")
@@ -1344,53 +1484,21 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     """
     Muestra la lista de comandos disponibles con /help.
     """
-    help_text = (
-        "🤖 **Comandos disponibles:**\n\n"
-        "/start - Iniciar o continuar el cuestionario\n"
-        "/status - Ver tu progreso actual\n"
-        "/info - Información sobre los cuestionarios\n"
-        "/reset - Reiniciar el cuestionario actual\n"
-        "/cancel - Cancelar el cuestionario\n"
-        "/help - Mostrar esta ayuda\n\n"
-        "💡 **Consejos:**\n"
-        "• El bot guarda tu progreso automáticamente\n"
-        "• Puedes continuar donde lo dejaste hasta 24 horas después\n"
-        "• Solo funciona en chats privados para proteger tu privacidad"
-    )
-    
-    await update.message.reply_text(help_text)
+    await update.message.reply_text(_HELP_TEXT)
 
 
 async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Muestra información sobre los cuestionarios con /info.
     """
-    info_text = (
-        "📋 **Información sobre los cuestionarios:**\n\n"
-        "**Cuestionario ADAM (10 preguntas)**\n"
-        "• Androgen Deficiency in Aging Males\n"
-        "• Preguntas de Sí/No sobre síntomas\n"
-        "• Detecta posible déficit de testosterona\n\n"
-        "**Cuestionario AMS (17 preguntas)**\n"
-        "• Aging Male's Symptoms\n"
-        "• Escala de 1-5 por severidad de síntomas\n"
-        "• Evaluación más detallada\n\n"
-        "**Preguntas de Estilo de Vida (6 preguntas)**\n"
-        "• Edad, grasa corporal, sueño, estrés\n"
-        "• Ejercicio y hábitos\n"
-        "• Factores que afectan la testosterona\n\n"
-        "⚠️ **Importante:** Este es solo un cuestionario orientativo.\n"
-        "NO reemplaza un análisis de sangre ni consulta médica."
-    )
-    
-    await update.message.reply_text(info_text)
+    await update.message.reply_text(_INFO_TEXT)
 
 
 async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Reinicia el cuestionario actual con /reset.
     """
-    user_id = update.effective_user.id if update.effective_user else None
+    user_id = _uid(update)
     
     # Clear all user data
     if conversation_handler:
@@ -1403,21 +1511,107 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     )
 
 
-async def timeout_reminder_task():
+# Cada cuánto se buscan sesiones que superaron el timeout
+REMINDER_INTERVAL_SECONDS = 300
+# Envíos de recordatorio simultáneos, para no chocar con los límites de Telegram
+REMINDER_CONCURRENCY = 20
+
+
+async def timeout_reminder_task(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Tarea periódica para enviar recordatorios de timeout.
+    Tarea periódica (JobQueue) para enviar recordatorios de timeout.
+    
+    Avisa a quienes superaron el timeout y aún no recibieron recordatorio;
+    el envío queda marcado en la sesión, así cada periodo de inactividad
+    recibe un único recordatorio aunque el bot haya estado caído.
     """
     if not conversation_handler:
         return
     
-    # This would need to be implemented with a job queue in a real application
-    # For now, it's a placeholder for the timeout reminder functionality
-    pass
+    user_ids = await conversation_handler.get_timed_out_users()
+    if not user_ids:
+        return
+    
+    semaphore = asyncio.Semaphore(REMINDER_CONCURRENCY)
+    
+    async def remind(user_id: int) -> None:
+        async with semaphore:
+            try:
+                # El bot solo funciona en chats privados: chat_id == user_id
+                await context.bot.send_message(chat_id=user_id, text=TIMEOUT_REMINDER_TEXT)
+            except Exception as e:
+                if logging_system:
+                    logging_system.log_error(e, context={"stage": "timeout_reminder"}, user_id=user_id)
+                else:
+                    logger.error("Could not send timeout reminder to %s: %s", user_id, e)
+                # Si el usuario bloqueó el bot no tiene sentido reintentar
+                if isinstance(e, Forbidden):
+                    conversation_handler.mark_reminded(user_id)
+                return
+            
+            conversation_handler.mark_reminded(user_id)
+            if logging_system:
+                logging_system.log_user_action(
+                    user_id, "timeout_reminder_sent",
+                    {"inactive_minutes": conversation_handler.timeout_minutes}
+                )
+    
+    await asyncio.gather(*(remind(user_id) for user_id in user_ids))
+
+
+class _PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Procesa en paralelo updates de usuarios distintos y en orden los de un mismo usuario.
+    
+    El ConversationHandler guarda el nuevo estado solo cuando el callback
+    termina: dos updates simultáneos del mismo usuario (p. ej. un doble toque
+    en un botón) verían ambos el estado anterior y se procesarían dos veces.
+    """
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_pending: Dict[int, int] = {}
+    
+    async def do_process_update(self, update: object, coroutine) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await coroutine
+            return
+        
+        user_id = user.id
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            # Se descarta el lock cuando no quedan updates del usuario
+            pending = self._user_pending[user_id] - 1
+            if pending:
+                self._user_pending[user_id] = pending
+            else:
+                del self._user_pending[user_id]
+                del self._user_locks[user_id]
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+
+
+async def _post_stop(application: Application) -> None:
+    """Detiene el guardado en segundo plano mientras el loop del bot sigue vivo."""
+    if conversation_handler:
+        await conversation_handler.stop()
 
 
 def main() -> None:
     """Función principal que configura y ejecuta el bot."""
-    global logging_system, error_handler, conversation_handler
+    global logging_system, error_handler, conversation_handler, _send, _send_results
     
     # Initialize configuration manager
     config_manager = ConfigManager()
@@ -1432,32 +1626,35 @@ def main() -> None:
         logging_system = LoggingSystem(logging_config)
         
         # Initialize error handler
-        from error_handler import RetryConfig
         retry_config = RetryConfig(
             max_retries=bot_config.max_retries,
             base_delay=1.0,
             max_delay=60.0
         )
         error_handler = ErrorHandler(logging_system, retry_config)
+        _send = error_handler.safe_send_message
+        _send_results = error_handler.with_retry(max_retries=3)(_send_results_once)
         
         # Initialize enhanced conversation handler
         conversation_handler = EnhancedConversationHandler(
             logging_system=logging_system,
             data_dir="data"
         )
+        conversation_handler.timeout_minutes = bot_config.timeout_minutes
         
         # Log successful initialization
         logging_system.log_info("Bot systems initialized successfully")
         
         # Log configuration summary (without sensitive data)
-        config_summary = config_manager.get_config_summary()
-        logging_system.log_info(f"Bot configuration loaded: {config_summary}")
+        if logging_system.is_info_enabled():
+            config_summary = config_manager.get_config_summary()
+            logging_system.log_info(f"Bot configuration loaded: {config_summary}")
         
     except ConfigurationError as e:
         if logging_system:
             logging_system.log_error(e, context={"stage": "configuration"})
         else:
-            logger.error(f"Configuration error: {e}")
+            logger.error("Configuration error: %s", e)
         
         print(f"❌ Configuration Error: {e}")
         print("\n💡 Quick Setup:")
@@ -1469,13 +1666,40 @@ def main() -> None:
         if logging_system:
             logging_system.log_error(e, context={"stage": "initialization"})
         else:
-            logger.error(f"Unexpected error during initialization: {e}")
+            logger.error("Unexpected error during initialization: %s", e)
         
         print(f"❌ Unexpected error: {e}")
         sys.exit(1)
     
+    # libuv-based loop for faster socket I/O when available (not on Windows)
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
     # Create application with secure token
-    application = Application.builder().token(token).build()
+    builder = (
+        Application.builder()
+        .token(token)
+        # Concurrente entre usuarios, secuencial por usuario (ver _PerUserUpdateProcessor)
+        .concurrent_updates(_PerUserUpdateProcessor(256))
+        .post_stop(_post_stop)
+        # All bot texts use <b>…</b>; set the parse mode once instead of per call
+        .defaults(Defaults(parse_mode=ParseMode.HTML))
+        # Bot API calls share multiplexed HTTP/2 connections instead of one TLS session each
+        .http_version("2")
+        .connection_pool_size(32)
+        .pool_timeout(20)
+        .connect_timeout(10)
+        .read_timeout(10)
+    )
+    if not bot_config.webhook_url:
+        # getUpdates uses its own small pool so slow sends never block long polling
+        builder = (
+            builder
+            .get_updates_connection_pool_size(4)
+            .get_updates_pool_timeout(20)
+            .get_updates_connect_timeout(10)
+        )
+    application = builder.build()
 
     # --- Configuración del ConversationHandler ---
     conv_handler = ConversationHandler(
@@ -1484,22 +1708,23 @@ def main() -> None:
             STATE_START: [CallbackQueryHandler(start_quiz_callback)],
             STATE_ADAM: [
                 CallbackQueryHandler(adam_handler, pattern="^adam_"),
-                CallbackQueryHandler(review_handler, pattern="^review_adam$"),
-                CallbackQueryHandler(modification_handler, pattern="^(continue_adam|modify_adam_last|restart_adam)$")
+                CallbackQueryHandler(review_handler, pattern=_route_pattern(REVIEW_ROUTES, "adam")),
+                CallbackQueryHandler(modification_handler, pattern=_route_pattern(MODIFICATION_ROUTES, "adam"))
             ],
             STATE_AMS: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, ams_handler),
-                CallbackQueryHandler(review_handler, pattern="^review_ams$"),
-                CallbackQueryHandler(modification_handler, pattern="^(continue_ams|modify_ams_last|restart_ams)$")
+                MessageHandler(AMS_SCORE_FILTER, ams_handler),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, ams_invalid_handler),
+                CallbackQueryHandler(review_handler, pattern=_route_pattern(REVIEW_ROUTES, "ams")),
+                CallbackQueryHandler(modification_handler, pattern=_route_pattern(MODIFICATION_ROUTES, "ams"))
             ],
             STATE_LIFESTYLE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, lifestyle_handler),
                 CallbackQueryHandler(lifestyle_button_handler, pattern="^ls_"),
-                CallbackQueryHandler(review_handler, pattern="^review_lifestyle$"),
-                CallbackQueryHandler(modification_handler, pattern="^(continue_lifestyle|modify_lifestyle_last|restart_lifestyle)$")
+                CallbackQueryHandler(review_handler, pattern=_route_pattern(REVIEW_ROUTES, "lifestyle")),
+                CallbackQueryHandler(modification_handler, pattern=_route_pattern(MODIFICATION_ROUTES, "lifestyle"))
             ],
             STATE_RESULTS: [
-                CallbackQueryHandler(results_action_handler, pattern="^(save_results|share_results|detailed_results|new_questionnaire)$")
+                CallbackQueryHandler(results_action_handler, pattern=_route_pattern(RESULTS_ROUTES))
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
@@ -1516,38 +1741,56 @@ def main() -> None:
     # Add error handler for unhandled errors
     async def global_error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle unhandled errors globally."""
+        # Sin Update (jobs, apagado...) no hay a quién avisar: solo se registra
+        if not isinstance(update, Update):
+            if logging_system:
+                logging_system.log_error(
+                    context.error,
+                    context={"function_name": "global_error_handler", "update_type": type(update).__name__}
+                )
+            else:
+                logger.error("Unhandled non-Update error: %s", context.error, exc_info=context.error)
+            return
+        
         if error_handler and logging_system:
-            user_id = None
-            chat_id = None
-            
-            if isinstance(update, Update):
-                user_id = update.effective_user.id if update.effective_user else None
-                chat_id = update.effective_chat.id if update.effective_chat else None
-            
-            error_context = ErrorContext(
-                user_id=user_id,
-                chat_id=chat_id,
-                function_name="global_error_handler",
-                additional_data={"update_type": type(update).__name__}
-            )
+            error_context = _make_ctx(update, _uid(update), "global_error_handler")
             
             recovery_action, user_message = await error_handler.handle_error(context.error, error_context)
             
-            # Try to send user message if we have update context
-            if user_message and isinstance(update, Update):
+            if user_message:
                 await error_handler.safe_send_message(update, context, user_message)
         else:
-            logger.error(f"Unhandled error: {context.error}")
+            logger.error("Unhandled error: %s", context.error)
     
     application.add_error_handler(global_error_handler)
 
+    # Recordatorios de inactividad (requiere el extra job-queue de PTB)
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(
+            timeout_reminder_task,
+            interval=REMINDER_INTERVAL_SECONDS,
+            first=REMINDER_INTERVAL_SECONDS
+        )
+    else:
+        logger.warning("JobQueue not available; timeout reminders are disabled")
+
     # Inicia el bot.
     try:
         print("🚀 El bot se ha iniciado y está esperando mensajes...")
         if logging_system:
             logging_system.log_info("Bot started successfully")
         
-        application.run_polling()
+        if bot_config.webhook_url:
+            # Telegram pushes updates to us; the secret token authenticates them
+            application.run_webhook(
+                listen="0.0.0.0",
+                port=bot_config.webhook_port,
+                url_path="telegram",
+                webhook_url=f"{bot_config.webhook_url}/telegram",
+                secret_token=bot_config.webhook_secret,
+            )
+        else:
+            application.run_polling()
         
     except KeyboardInterrupt:
         print("\n🛑 Bot detenido por el usuario")
@@ -1563,6 +1806,7 @@ def main() -> None:
             conversation_handler.cleanup()
         if logging_system:
             logging_system.log_info("Bot shutdown completed")
+            logging_system.close()
 
 
 if __name__ == "__main__":
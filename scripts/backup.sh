@@ -45,15 +45,35 @@ create_backup_dir() {
     fi
 }
 
+# Copy the data directory. The SQLite state database runs in WAL mode, so
+# copying state.db (and its -wal file) while the bot writes can give an
+# inconsistent copy; it is snapshotted with VACUUM INTO instead.
+copy_data_dir() {
+    local src="$1"
+    local dest="$2"
+    
+    mkdir -p "$dest"
+    find "$src" -mindepth 1 -maxdepth 1 \
+         ! -name 'state.db' ! -name 'state.db-wal' ! -name 'state.db-shm' \
+         -exec cp -r {} "$dest/" \; 2>/dev/null || true
+    if [[ -f "$src/state.db" ]]; then
+        python3 -c 'import sqlite3, sys; sqlite3.connect(sys.argv[1]).execute("VACUUM INTO ?", (sys.argv[2],))' \
+            "$src/state.db" "$dest/state.db" || warn "Could not snapshot state.db"
+    fi
+}
+
 # Backup data files
 backup_data() {
     log "Backing up data files..."
     
     if [[ -d "$DATA_DIR" ]]; then
-        tar -czf "$BACKUP_DIR/data_backup_$DATE.tar.gz" -C "$DATA_DIR" . 2>/dev/null || {
+        local snapshot_dir=$(mktemp -d)
+        copy_data_dir "$DATA_DIR" "$snapshot_dir"
+        tar -czf "$BACKUP_DIR/data_backup_$DATE.tar.gz" -C "$snapshot_dir" . 2>/dev/null || {
             warn "No data files found to backup"
             touch "$BACKUP_DIR/data_backup_$DATE.tar.gz"
         }
+        rm -rf "$snapshot_dir"
         log "Data backup completed: data_backup_$DATE.tar.gz"
     else
         warn "Data directory not found: $DATA_DIR"
@@ -103,8 +123,7 @@ create_comprehensive_backup() {
     
     # Copy data
     if [[ -d "$DATA_DIR" ]]; then
-        mkdir -p "$TEMP_DIR/data"
-        cp -r "$DATA_DIR"/* "$TEMP_DIR/data/" 2>/dev/null || true
+        copy_data_dir "$DATA_DIR" "$TEMP_DIR/data"
     fi
     
     # Copy configuration (excluding sensitive files)
@@ -144,10 +144,16 @@ backup_current_state() {
     # Create temporary directory
     local temp_dir=$(mktemp -d)
     
-    # Backup current data
+    # Backup current data (state.db is snapshotted: it may be open in WAL mode)
     if [[ -d "$DATA_DIR" ]]; then
         mkdir -p "$temp_dir/data"
-        cp -r "$DATA_DIR"/* "$temp_dir/data/" 2>/dev/null || true
+        find "$DATA_DIR" -mindepth 1 -maxdepth 1 \
+             ! -name 'state.db' ! -name 'state.db-wal' ! -name 'state.db-shm' \
+             -exec cp -r {} "$temp_dir/data/" \; 2>/dev/null || true
+        if [[ -f "$DATA_DIR/state.db" ]]; then
+            python3 -c 'import sqlite3, sys; sqlite3.connect(sys.argv[1]).execute("VACUUM INTO ?", (sys.argv[2],))' \
+                "$DATA_DIR/state.db" "$temp_dir/data/state.db" || warn "Could not snapshot state.db"
+        fi
     fi
     
     # Backup current config